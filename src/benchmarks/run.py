@@ -0,0 +1,148 @@
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+from core.ledger import Ledger
+from storage.excelRepository import PandasExcelLedgerRepository
+from storage.cachedRepository import CachedLedgerRepository
+from services.reporting import ReportingService
+from .synthetic import generateLedger, generateRates, writeImportFile
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+# added by --large, slow enough (minutes per case on excel) to stay out of the default run
+LARGE_SIZES = [1_000_000]
+SRC = Path(__file__).resolve().parents[1]
+
+# times fn `repeat` times, then once more under tracemalloc for the peak
+def measure(fn, setup=None, repeat=3):
+    times = []
+    for _ in range(repeat):
+        state = setup() if setup else None
+        t0 = time.perf_counter()
+        fn(state)
+        times.append(time.perf_counter() - t0)
+    state = setup() if setup else None
+    tracemalloc.start()
+    try:
+        fn(state)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"seconds": statistics.median(times), "min": min(times), "peakBytes": peak}
+
+def benchSize(rows, workdir, repeat, shape):
+    results = {}
+    snapshot = workdir / f"ledger_{rows}.xlsx"
+    importFile = workdir / f"import_{rows}.xlsx"
+    ledger = generateLedger(rows, **shape)
+    repo = PandasExcelLedgerRepository(snapshot)
+    month = ledger.listTransactions(None)[rows // 2].date.strftime("%Y-%m")
+
+    results["repository.save"] = measure(lambda _: repo.save(ledger), repeat=repeat)
+    results["repository.load"] = measure(lambda _: repo.load(), repeat=repeat)
+    results["repository.exportTransactions.csv"] = measure(
+        lambda _: repo.exportTransactions(workdir / f"export_{rows}.csv"), repeat=repeat
+    )
+    results["ledger.listTransactions"] = measure(lambda _: ledger.listTransactions(month), repeat=repeat)
+    # through the workbook's stored MonthlyTotals sheet
+    results["reporting.monthlySummary"] = measure(lambda _: ReportingService(repo).monthlySummary(month), repeat=repeat)
+    # the in-memory path: every row through MonthlyAggregates, then a range the stored sheet can't answer
+    # (it doesn't start on the 1st) summarized from a cached ledger
+    results["ledger.rebuildAggregates"] = measure(lambda _: ledger.rebuildAggregates(), repeat=repeat)
+    cached = CachedLedgerRepository(repo)
+    cached.load()
+    first, last = ledger.listTransactions(None)[0].date, ledger.listTransactions(None)[-1].date
+    results["reporting.rangeSummary.inMemory"] = measure(
+        lambda _: ReportingService(cached).rangeSummary(first.replace(day=2), last, "quarter"), repeat=repeat
+    )
+    # every row in another currency, converted at its own day's rate
+    foreign = generateLedger(rows, currency="USD", **shape)
+    rates = generateRates(days=shape.get("days", 5 * 365))
+    results["reporting.convertedTotals"] = measure(
+        lambda _: ReportingService(repo, rates).convertedTotals(foreign, None, None), repeat=repeat
+    )
+    # a fresh interpreter every time, imports included
+    cli = [sys.executable, str(SRC / "cli.py"), "--repo", str(snapshot), "summary", "--month", month]
+    results["cli.summary.coldStart"] = measure(lambda _: subprocess.run(cli, check=True, capture_output=True), repeat=repeat)
+    writeImportFile(importFile, rows, **shape)
+    results["repository.importTransactions"] = measure(
+        lambda fresh: repo.importTransactions(importFile, fresh), setup=Ledger, repeat=repeat
+    )
+    return results
+
+# shape: accounts / categories / parties / days passed through to the generator
+def runBenchmarks(sizes, repeat=3, workdir=None, **shape):
+    out = {
+        "meta": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "sizes": sizes,
+            "shape": shape,
+        },
+        "results": [],
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(workdir or tmp)
+        for rows in sizes:
+            for case, r in benchSize(rows, workdir, repeat, shape).items():
+                out["results"].append({"case": case, "rows": rows, **r})
+                print(f"{case:32} {rows:>9} rows  {r['seconds'] * 1000:10.2f} ms  peak {r['peakBytes'] / 1e6:8.1f} MB")
+    return out
+
+# (case, rows, old, new, ratio) for every result in both runs, ratio > 1 means slower
+def compareRuns(old, new):
+    before = {(r["case"], r["rows"]): r for r in old["results"]}
+    rows = []
+    for r in new["results"]:
+        key = (r["case"], r["rows"])
+        if key in before and before[key]["seconds"] > 0:
+            rows.append((*key, before[key]["seconds"], r["seconds"], r["seconds"] / before[key]["seconds"]))
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time storage, ledger and reporting paths on synthetic ledgers.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run")
+    run.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="comma separated row counts")
+    run.add_argument("--large", action="store_true", help=f"also run {', '.join(map(str, LARGE_SIZES))} rows")
+    run.add_argument("--repeat", type=int, default=3)
+    run.add_argument("--out", type=Path, help="write results as json")
+    run.add_argument("--accounts", type=int, default=5)
+    run.add_argument("--categories", type=int, default=20)
+    run.add_argument("--days", type=int, default=5 * 365, help="date span of the generated ledger")
+    cmp = sub.add_parser("compare")
+    cmp.add_argument("old", type=Path)
+    cmp.add_argument("new", type=Path)
+    cmp.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 = 20%%")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        sizes = [int(s) for s in args.sizes.split(",") if s]
+        if args.large:
+            sizes += [n for n in LARGE_SIZES if n not in sizes]
+        results = runBenchmarks(sizes, args.repeat, accounts=args.accounts, categories=args.categories, days=args.days)
+        if args.out:
+            args.out.write_text(json.dumps(results, indent=2))
+        return 0
+
+    rows = compareRuns(json.loads(args.old.read_text()), json.loads(args.new.read_text()))
+    regressed = False
+    for case, n, old, new, ratio in rows:
+        flag = ""
+        if ratio > 1 + args.threshold:
+            flag = "  REGRESSION"
+            regressed = True
+        print(f"{case:32} {n:>9} rows  {old * 1000:10.2f} -> {new * 1000:10.2f} ms  x{ratio:5.2f}{flag}")
+    return 1 if regressed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
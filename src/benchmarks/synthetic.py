@@ -0,0 +1,47 @@
+import random
+from datetime import date, timedelta
+from uuid import UUID
+
+from core.ledger import Ledger
+from core.account import Account
+from core.transaction import Income, Expense
+from core.rates import RateTable
+from storage.streamingExport import exportTransactions
+
+# deterministic fake ledgers for benchmarking, same seed -> same ledger
+def generateTransactions(rows, accounts=5, categories=20, parties=200, start=date(2015, 1, 1), days=5 * 365, seed=0,
+                         currency=None):
+    rng = random.Random(seed)
+    accountNames = [f"account{i}" for i in range(accounts)]
+    categoryNames = [f"category{i}" for i in range(categories)]
+    partyNames = [f"party{i}" for i in range(parties)]
+    # spread rows evenly over the span, in date order like a real export
+    step = days / max(rows, 1)
+    for i in range(rows):
+        tid = str(UUID(int=rng.getrandbits(128), version=4))
+        d = start + timedelta(days=int(i * step))
+        account = rng.choice(accountNames)
+        category = rng.choice(categoryNames)
+        party = rng.choice(partyNames)
+        amount = round(rng.uniform(1, 2000), 2)
+        if rng.random() < 0.3:
+            yield Income(tid, d, account, category, amount, party, "", currency)
+        else:
+            yield Expense(tid, d, account, category, amount, party, "", currency)
+
+def generateLedger(rows, ledgerType=Ledger, **kwargs):
+    ledger = ledgerType()
+    for t in generateTransactions(rows, **kwargs):
+        if not ledger.getAccount(t.account):
+            ledger.addAccount(Account(t.account))
+        ledger.addTransaction(t)
+    return ledger
+
+# a rate for every day of the generator's span, so each row converts at a different one
+def generateRates(currency="USD", start=date(2015, 1, 1), days=5 * 365, seed=0):
+    rng = random.Random(seed)
+    return RateTable({currency: [(start + timedelta(days=i), round(rng.uniform(1.2, 1.45), 4)) for i in range(days + 1)]})
+
+# an import file in the repo's transaction schema
+def writeImportFile(path, rows, seed=1, **kwargs):
+    exportTransactions(generateTransactions(rows, seed=seed, **kwargs), path)
@@ -0,0 +1,142 @@
+import argparse
+import sys
+from datetime import date
+from pathlib import Path
+
+from core import instrumentation
+from core.ledger import monthBounds
+from core.search import parseQuery
+from core.transaction import Transaction
+from services.reporting import ReportingService
+from main import SNAPSHOT_PATH, RATES_PATH, openRepository, loadRates
+
+def add(repo, args):
+    kind = args.type.upper()
+    transaction = Transaction.fromSpec({
+        "kind": kind,
+        "date": args.date,
+        "account": args.account,
+        "category": args.category,
+        "amount": args.amount,
+        "payor": args.party if kind == "INCOME" else None,
+        "payee": args.party if kind == "EXPENSE" else None,
+        "notes": args.notes,
+        "currency": args.currency,
+    })
+    repo.appendTransaction(transaction)
+    print(f"Added transaction {transaction.id}")
+
+def summary(repo, args):
+    report = ReportingService(repo, loadRates(args.rates)).monthlySummary(args.month)
+    print(f"Month: {report.month}\nIncome: {report.income:.2f}\nExpense: {report.expense:.2f}\nNet: {report.net:.2f}")
+    if args.categories:
+        for c in report.byCategory:
+            print(f"  {c.category:24} {c.total:12.2f} {c.count:6d}")
+
+def printDuplicates(result, limit=20):
+    for d in result.duplicates[:limit]:
+        action = "skipped" if d.skipped else "imported anyway"
+        print(f"  row {d.row} (id={d.id}) looks like {d.existingId}, {action}")
+    if len(result.duplicates) > limit:
+        print(f"  ... and {len(result.duplicates) - limit} more")
+
+def importFile(repo, args):
+    duplicates = "skip" if args.skip_duplicates else "flag"
+    if len(args.paths) == 1:
+        result = repo.importFile(args.paths[0], duplicates=duplicates, toleranceDays=args.tolerance_days)
+        print(f"Imported {result.added} transactions, {result.knownIds} already known, "
+              f"{len(result.duplicates)} probable duplicates.")
+        printDuplicates(result)
+        return
+    result = repo.importFiles(args.paths, workers=args.workers, duplicates=duplicates, toleranceDays=args.tolerance_days)
+    for f in result.files:
+        if f.ok:
+            print(f"{f.path}: {f.rowsRead} rows, {f.added} new, {f.knownIds} already known, "
+                  f"{len(f.duplicates)} probable duplicates")
+            printDuplicates(f)
+        else:
+            print(f"{f.path}: not imported\n  " + f.error.replace("\n", "\n  "))
+    print(f"Imported {result.added} transactions from {len(result.files) - len(result.failed)} of {len(result.files)} files.")
+    if result.failed:
+        raise ValueError(f"{len(result.failed)} file(s) could not be imported")
+
+def export(repo, args):
+    report = ReportingService(repo, loadRates(args.rates)).monthlySummary(args.month)
+    repo.exportReport(report, args.path)
+    print(f"Saved report to {args.path}")
+
+def exportTransactions(repo, args):
+    start, end = monthBounds(args.month) if args.month else (args.start, args.end)
+    written = repo.exportTransactions(args.path, start, end)
+    print(f"Saved {written} transactions to {args.path}")
+
+def search(repo, args):
+    start, end = monthBounds(args.month) if args.month else (None, None)
+    txs = repo.load().search(**parseQuery(" ".join(args.query)), start=start, end=end, limit=args.limit)
+    for t in txs:
+        print(f"{t.date.isoformat()}  {t.account:12} {t.category:16} {t.party:24} {t.effectiveAmount():12.2f}  {t.notes}")
+    print(f"{len(txs)} transactions")
+
+def buildParser():
+    parser = argparse.ArgumentParser(prog="financeTracker", description="Finance tracker without the window.")
+    parser.add_argument("--repo", type=Path, default=SNAPSHOT_PATH, help="ledger workbook (default: storage/excelTracker.xlsx)")
+    parser.add_argument("--rates", type=Path, default=RATES_PATH,
+                        help="date,currency,rate csv for converting other currencies (default: storage/rates.csv)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("add", help="record an income or expense")
+    p.add_argument("--type", choices=["income", "expense", "INCOME", "EXPENSE"], default="expense")
+    p.add_argument("--date", required=True, help="YYYY-MM-DD")
+    p.add_argument("--account", required=True)
+    p.add_argument("--category", default="")
+    p.add_argument("--amount", type=float, required=True)
+    p.add_argument("--party", required=True, help="payor for income, payee for expenses")
+    p.add_argument("--notes", default="")
+    p.add_argument("--currency", type=str.upper, help="e.g. USD, defaults to the account's currency")
+    p.set_defaults(run=add)
+
+    p = sub.add_parser("summary", help="income, expense and net for a month")
+    p.add_argument("--month", required=True, help="YYYY-MM")
+    p.add_argument("--categories", action="store_true", help="also list totals per category")
+    p.set_defaults(run=summary)
+
+    p = sub.add_parser("import", help="import transactions from .xlsx or .csv files")
+    p.add_argument("paths", type=Path, nargs="+")
+    p.add_argument("--workers", type=int, help="parser processes for several files (default: one per cpu)")
+    p.add_argument("--skip-duplicates", action="store_true",
+                   help="leave out rows matching a stored transaction on date, account, amount and party")
+    p.add_argument("--tolerance-days", type=int, default=0, help="how far apart dates of a duplicate may be")
+    p.set_defaults(run=importFile)
+
+    p = sub.add_parser("search", help="find transactions by words in notes/party and account:, category:, type: filters")
+    p.add_argument("query", nargs="+")
+    p.add_argument("--month", help="YYYY-MM")
+    p.add_argument("--limit", type=int)
+    p.set_defaults(run=search)
+
+    p = sub.add_parser("export", help="write a month's report to an .xlsx file")
+    p.add_argument("--month", required=True, help="YYYY-MM")
+    p.add_argument("path", type=Path)
+    p.set_defaults(run=export)
+
+    p = sub.add_parser("export-transactions", help="write transactions to an .xlsx or .csv file, oldest first")
+    p.add_argument("--month", help="YYYY-MM, instead of --start/--end")
+    p.add_argument("--start", type=date.fromisoformat, help="YYYY-MM-DD, first day included")
+    p.add_argument("--end", type=date.fromisoformat, help="YYYY-MM-DD, first day left out")
+    p.add_argument("path", type=Path)
+    p.set_defaults(run=exportTransactions)
+    return parser
+
+def main(argv=None):
+    args = buildParser().parse_args(argv)
+    repo = openRepository(args.repo)
+    try:
+        args.run(repo, args)
+    except ValueError as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    instrumentation.installExitDump()
+    sys.exit(main())
@@ -1,7 +1,12 @@
+# what amounts are in when nothing says otherwise, and what reports are converted into
+DEFAULT_CURRENCY = "CAD"
+
 class Account:
-    def __init__(self, name: str, type: str = "CASH"):
+    # currency of the account, what its transactions are in unless they say otherwise
+    def __init__(self, name: str, type: str = "CASH", currency: str = DEFAULT_CURRENCY):
         self.name = name
         self.type = type
+        self.currency = currency or DEFAULT_CURRENCY
 
     def __repr__(self) -> str:
-        return f"Account(name={self.name!r}, type={self.type!r})"
\ No newline at end of file
+        return f"Account(name={self.name!r}, type={self.type!r}, currency={self.currency!r})"
\ No newline at end of file
@@ -0,0 +1,185 @@
+from datetime import date
+
+from .account import DEFAULT_CURRENCY
+
+def monthKey(d):
+    return f"{d.year:04d}-{d.month:02d}"
+
+# 'YYYY-MM' keys of every month touched by start <= date < end
+def monthKeys(start, end):
+    keys = []
+    y, m = start.year, start.month
+    while date(y, m, 1) < end:
+        keys.append(f"{y:04d}-{m:02d}")
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+    return keys
+
+# label of the report period a 'YYYY-MM' month falls in
+PERIOD_LABELS = {
+    "month": lambda key: key,
+    "quarter": lambda key: f"{key[:4]}-Q{(int(key[5:7]) - 1) // 3 + 1}",
+    "year": lambda key: key[:4],
+}
+
+# transactions without a currency of their own haven't been through a ledger yet, they count as the default
+def isForeign(transaction):
+    currency = getattr(transaction, "currency", None)
+    return currency is not None and currency != DEFAULT_CURRENCY
+
+# running totals for one (month, category), amounts kept in cents so add/remove never drift
+class CategoryTotals:
+    __slots__ = ("incomeCents", "expenseCents", "count", "first", "foreign")
+
+    def __init__(self, incomeCents=0, expenseCents=0, count=0, first=None, foreign=0):
+        self.incomeCents = incomeCents
+        self.expenseCents = expenseCents
+        self.count = count
+        # smallest (date, id) in the bucket, reports list categories in order of first appearance
+        self.first = first
+        # rows not in DEFAULT_CURRENCY. their amounts are summed as they are, so a bucket with any
+        # has to be converted from the transactions before it can be reported
+        self.foreign = foreign
+
+    @property
+    def total(self):
+        return (self.incomeCents + self.expenseCents) / 100
+
+class MonthTotals:
+    def __init__(self):
+        self.categories = {}
+        # categories whose 'first' was removed and needs recomputing from the ledger
+        self.stale = False
+
+    @property
+    def income(self):
+        return sum(c.incomeCents for c in self.categories.values()) / 100
+
+    @property
+    def expense(self):
+        return sum(c.expenseCents for c in self.categories.values()) / 100
+
+    @property
+    def net(self):
+        return self.income - self.expense
+
+    @property
+    def foreign(self):
+        return sum(c.foreign for c in self.categories.values())
+
+    def orderedCategories(self):
+        return sorted(self.categories.items(), key=lambda kv: kv[1].first)
+
+    # folds another month's totals into this one, for quarter/year periods
+    def merge(self, other):
+        for category, o in other.categories.items():
+            ct = self.categories.get(category)
+            if ct is None:
+                self.categories[category] = CategoryTotals(o.incomeCents, o.expenseCents, o.count, o.first, o.foreign)
+                continue
+            ct.incomeCents += o.incomeCents
+            ct.expenseCents += o.expenseCents
+            ct.count += o.count
+            ct.foreign += o.foreign
+            if o.first < ct.first:
+                ct.first = o.first
+
+# per-month and per-(month, category) totals, updated on every Ledger.addTransaction
+class MonthlyAggregates:
+    def __init__(self):
+        self._months = {}
+
+    def add(self, transaction):
+        e = transaction.effectiveAmount()
+        cents = round(abs(e) * 100)
+        key = (transaction.date, transaction.id)
+        month = self._months.setdefault(monthKey(transaction.date), MonthTotals())
+        ct = month.categories.get(transaction.category)
+        if ct is None:
+            ct = month.categories[transaction.category] = CategoryTotals(first=key)
+        elif key < ct.first:
+            ct.first = key
+        if e > 0:
+            ct.incomeCents += cents
+        elif e < 0:
+            ct.expenseCents += cents
+        ct.count += 1
+        if isForeign(transaction):
+            ct.foreign += 1
+
+    def remove(self, transaction):
+        e = transaction.effectiveAmount()
+        cents = round(abs(e) * 100)
+        month = self._months.get(monthKey(transaction.date))
+        if month is None or transaction.category not in month.categories:
+            return
+        ct = month.categories[transaction.category]
+        if e > 0:
+            ct.incomeCents -= cents
+        elif e < 0:
+            ct.expenseCents -= cents
+        ct.count -= 1
+        if isForeign(transaction):
+            ct.foreign -= 1
+        if ct.count <= 0:
+            del month.categories[transaction.category]
+        elif ct.first == (transaction.date, transaction.id):
+            month.stale = True
+
+    # totals for 'YYYY-MM', listMonth is only called when the bucket has to be rebuilt
+    def month(self, key, listMonth):
+        month = self._months.get(key)
+        if month is None:
+            return MonthTotals()
+        if month.stale:
+            del self._months[key]
+            for t in listMonth():
+                self.add(t)
+            month = self._months.get(key, MonthTotals())
+        return month
+
+    def months(self):
+        return sorted(self._months)
+
+    def byMonth(self):
+        return dict(self._months)
+
+    def rebuild(self, transactions):
+        self._months = {}
+        for t in transactions:
+            self.add(t)
+
+    # flat rows for storing next to the snapshot
+    def records(self):
+        return [r for key in sorted(self._months) for r in self.monthRecords(key, self._months[key])]
+
+    # the rows of one month, the inverse of monthFromRecords
+    @staticmethod
+    def monthRecords(key, month):
+        return [
+            {
+                "month": key,
+                "category": category,
+                "income": ct.incomeCents / 100,
+                "expense": ct.expenseCents / 100,
+                "count": ct.count,
+                "firstDate": ct.first[0].isoformat(),
+                "firstId": ct.first[1],
+                "foreign": ct.foreign,
+            }
+            for category, ct in month.categories.items()
+        ]
+
+    # a single month back from stored rows, same shape as month()
+    @staticmethod
+    def monthFromRecords(rows):
+        month = MonthTotals()
+        for r in rows:
+            month.categories[r["category"]] = CategoryTotals(
+                round(float(r["income"]) * 100),
+                round(float(r["expense"]) * 100),
+                int(r["count"]),
+                (date.fromisoformat(str(r["firstDate"])[:10]), str(r["firstId"])),
+                # rows stored before currencies existed don't have it
+                int(r.get("foreign") or 0),
+            )
+        return month
@@ -0,0 +1,103 @@
+from bisect import bisect_left, insort
+from datetime import date
+
+# one account's net movement per day in a fenwick tree over a dense range of day ordinals, so a
+# back-dated add costs the same as one on the latest date: O(log D) to add or to ask for the balance on
+# a day, D being the days the range covers. the range grows (and the tree is rebuilt, O(D)) only when a
+# day falls outside it, doubling each time so that's amortised away
+class _AccountHistory:
+    __slots__ = ("days", "cents", "base", "tree")
+
+    def __init__(self):
+        # distinct day ordinals with activity in order, with the net cents moved on each
+        self.days = []
+        self.cents = {}
+        # tree[i] (1-based) covers days base+i-(i&-i) .. base+i-1
+        self.base = 0
+        self.tree = [0]
+
+    def add(self, day, cents):
+        if day not in self.cents:
+            insort(self.days, day)
+            self.cents[day] = 0
+        self.cents[day] += cents
+        if not self.base <= day < self.base + len(self.tree) - 1:
+            self._grow(day)
+            return
+        tree = self.tree
+        i = day - self.base + 1
+        while i < len(tree):
+            tree[i] += cents
+            i += i & -i
+
+    # balance in cents at the end of the given day ordinal
+    def at(self, day):
+        if day < self.base:
+            return 0
+        tree = self.tree
+        i = min(day - self.base + 1, len(tree) - 1)
+        total = 0
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    # rebuilds the tree over a range at least twice as wide that also covers day, slack on the side it grew
+    def _grow(self, day):
+        size = len(self.tree) - 1
+        lo, hi = (day, day) if not size else (min(day, self.base), max(day, self.base + size - 1))
+        width = max(hi - lo + 1, 2 * size, 64)
+        self.base = hi - width + 1 if size and day < self.base else lo
+        tree = [0] * (width + 1)
+        for d, c in self.cents.items():
+            tree[d - self.base + 1] += c
+        # linear fenwick build, every node passes its sum on to its parent
+        for i in range(1, width + 1):
+            parent = i + (i & -i)
+            if parent <= width:
+                tree[parent] += tree[i]
+        self.tree = tree
+
+# per-account running balances, kept up to date on every Ledger.addTransaction
+class AccountBalances:
+    def __init__(self):
+        self._accounts = {}
+
+    def add(self, transaction):
+        self._history(transaction.account).add(transaction.date.toordinal(), round(transaction.effectiveAmount() * 100))
+
+    def remove(self, transaction):
+        self._history(transaction.account).add(transaction.date.toordinal(), -round(transaction.effectiveAmount() * 100))
+
+    def _history(self, account):
+        h = self._accounts.get(account)
+        if h is None:
+            h = self._accounts[account] = _AccountHistory()
+        return h
+
+    # balance at the end of as_of (a date, None for everything), O(log D)
+    def balance(self, account, as_of=None):
+        h = self._accounts.get(account)
+        if h is None or not h.days:
+            return 0.0
+        day = h.days[-1] if as_of is None else as_of.toordinal()
+        return h.at(day) / 100
+
+    # (date, balance at the end of that date) for every day with activity in start <= date < end
+    def history(self, account, start=None, end=None):
+        h = self._accounts.get(account)
+        if h is None:
+            return []
+        lo = 0 if start is None else bisect_left(h.days, start.toordinal())
+        hi = len(h.days) if end is None else bisect_left(h.days, end.toordinal())
+        if lo >= hi:
+            return []
+        running = h.at(h.days[lo] - 1)
+        history = []
+        for day in h.days[lo:hi]:
+            running += h.cents[day]
+            history.append((date.fromordinal(day), running / 100))
+        return history
+
+    def accounts(self):
+        return list(self._accounts)
@@ -0,0 +1,321 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date
+from uuid import UUID
+
+from .ledger import LedgerBase
+from .transaction import Income, Expense
+
+INCOME, EXPENSE = 1, 0
+_NO_UUID = bytes(16)
+
+# interns repeated strings (accounts, categories, parties, notes) so each is stored once
+class StringPool:
+    def __init__(self):
+        self._strings = []
+        self._ids = {}
+
+    def intern(self, s):
+        sid = self._ids.get(s)
+        if sid is None:
+            sid = len(self._strings)
+            self._strings.append(s)
+            self._ids[s] = sid
+        return sid
+
+    def get(self, sid):
+        return self._strings[sid]
+
+    def __len__(self):
+        return len(self._strings)
+
+# flyweight over one row of a ColumnarLedger, looks like an Income/Expense to the rest of the app
+class ColumnarTransaction:
+    __slots__ = ("_ledger", "_row")
+
+    def __init__(self, ledger, row):
+        self._ledger = ledger
+        self._row = row
+
+    @property
+    def id(self):
+        return self._ledger._idAt(self._row)
+
+    @property
+    def date(self):
+        return date.fromordinal(self._ledger._dates[self._row])
+
+    @property
+    def account(self):
+        return self._ledger._strings.get(self._ledger._accountIds[self._row])
+
+    @property
+    def category(self):
+        return self._ledger._strings.get(self._ledger._categoryIds[self._row])
+
+    @property
+    def notes(self):
+        return self._ledger._strings.get(self._ledger._notesIds[self._row])
+
+    @property
+    def party(self):
+        return self._ledger._strings.get(self._ledger._partyIds[self._row])
+
+    @property
+    def isIncome(self):
+        return self._ledger._kinds[self._row] == INCOME
+
+    @property
+    def kind(self):
+        return "INCOME" if self.isIncome else "EXPENSE"
+
+    @property
+    def payor(self):
+        return self.party if self.isIncome else None
+
+    @property
+    def payee(self):
+        return None if self.isIncome else self.party
+
+    @property
+    def amount(self):
+        return self._ledger._cents[self._row] / 100
+
+    @property
+    def cents(self):
+        return self._ledger._cents[self._row]
+
+    @property
+    def currency(self):
+        return self._ledger._strings.get(self._ledger._currencyIds[self._row])
+
+    def effectiveAmount(self):
+        return self.amount if self.isIncome else -self.amount
+
+    def getInformation(self):
+        raise NotImplementedError
+
+    def record(self):
+        income = self.isIncome
+        return {
+            "id": self.id,
+            "date": self.date.isoformat(),
+            "account": self.account,
+            "category": self.category,
+            "type": "INCOME" if income else "EXPENSE",
+            "amount": float(self.amount),
+            "notes": self.notes,
+            "payor": self.party if income else "",
+            "payee": "" if income else self.party,
+            "currency": self.currency,
+        }
+
+    def row(self):
+        income = self.isIncome
+        party = self.party
+        return (self.id, self.date.isoformat(), self.account, self.category, "INCOME" if income else "EXPENSE",
+                float(self.amount), self.notes, party if income else "", "" if income else party, self.currency)
+
+    def __eq__(self, other):
+        return isinstance(other, ColumnarTransaction) and other._ledger is self._ledger and other._row == self._row
+
+    def __hash__(self):
+        return hash((id(self._ledger), self._row))
+
+    # a plain Income/Expense with this row's current values, which a later replace won't change
+    def detach(self):
+        if self.isIncome:
+            return Income(self.id, self.date, self.account, self.category, self.amount, self.party, self.notes,
+                          self.currency)
+        return Expense(self.id, self.date, self.account, self.category, self.amount, self.party, self.notes,
+                       self.currency)
+
+    def __repr__(self):
+        return f"ColumnarTransaction(id={self.id!r}, date={self.date!r}, amount={self.effectiveAmount()!r})"
+
+# re-iterable, sized view over every row, like dict.values() on Ledger
+class _AllTransactions:
+    def __init__(self, ledger):
+        self._ledger = ledger
+
+    def __len__(self):
+        return len(self._ledger._dates) - len(self._ledger._removed)
+
+    def __iter__(self):
+        ledger = self._ledger
+        removed = ledger._removed
+        return (ColumnarTransaction(ledger, row) for row in range(len(ledger._dates)) if row not in removed)
+
+# same API as Ledger but every field lives in a typed array (dates as ordinals, amounts as cents)
+# and strings are dictionary encoded, transactions are handed out as flyweight views
+class ColumnarLedger(LedgerBase):
+    def __init__(self):
+        super().__init__()
+        self._strings = StringPool()
+
+        self._dates = array("i")
+        self._cents = array("q")
+        self._kinds = array("b")
+        self._accountIds = array("i")
+        self._categoryIds = array("i")
+        self._partyIds = array("i")
+        self._notesIds = array("i")
+        self._currencyIds = array("i")
+
+        # uuid ids are stored as 16 raw bytes, anything else goes in the sparse map
+        self._uuidBytes = bytearray()
+        self._otherIds = {}
+        # hash of each id, so probing and rehashing don't rebuild id strings
+        self._idHashes = array("q")
+
+        # open addressing id -> row+1 table (0 = empty slot)
+        self._slots = array("i", bytes(4 * 16))
+        # rows ordered by (date, id)
+        self._order = array("i")
+        # rows taken out by removeTransaction. they stay in the arrays as tombstones, so row numbers
+        # (and the views already handed out) never shift
+        self._removed = set()
+
+    # Ids
+    def _idAt(self, row):
+        other = self._otherIds.get(row)
+        if other is not None:
+            return other
+        h = self._uuidBytes[16 * row:16 * row + 16].hex()
+        return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+    def _storeId(self, row, tid):
+        raw = _NO_UUID
+        try:
+            u = UUID(tid)
+            if str(u) == tid:
+                raw = u.bytes
+        except (ValueError, TypeError, AttributeError):
+            pass
+        if raw is _NO_UUID:
+            self._otherIds[row] = tid
+        else:
+            self._otherIds.pop(row, None)
+        if row * 16 == len(self._uuidBytes):
+            self._uuidBytes += raw
+        else:
+            self._uuidBytes[16 * row:16 * row + 16] = raw
+
+    def _findRow(self, tid):
+        slots = self._slots
+        mask = len(slots) - 1
+        h = hash(tid)
+        i = h & mask
+        while slots[i]:
+            row = slots[i] - 1
+            if self._idHashes[row] == h and row not in self._removed and self._idAt(row) == tid:
+                return row
+            i = (i + 1) & mask
+        return None
+
+    def _insertSlot(self, h, row):
+        slots = self._slots
+        mask = len(slots) - 1
+        i = h & mask
+        while slots[i]:
+            i = (i + 1) & mask
+        slots[i] = row + 1
+
+    def _growSlots(self):
+        self._slots = array("i", bytes(4 * len(self._slots) * 2))
+        for row, h in enumerate(self._idHashes):
+            if row not in self._removed:
+                self._insertSlot(h, row)
+
+    # where row belongs in the (date, id) order, ids are only compared among rows on the same date.
+    # for a row that's already in the order that's where it is
+    def _orderPosition(self, row):
+        order, dates = self._order, self._dates
+        d = dates[row]
+        lo = bisect_left(order, d, key=dates.__getitem__)
+        hi = bisect_right(order, d, lo=lo, key=dates.__getitem__)
+        return bisect_left(order, self._idAt(row), lo, hi, key=self._idAt)
+
+    # Row storage
+    def _find(self, transactionID):
+        row = self._findRow(str(transactionID))
+        return None if row is None else ColumnarTransaction(self, row)
+
+    # same id again overwrites the row in place, like dict assignment in Ledger
+    def _put(self, transaction, currency, previous):
+        tid = str(transaction.id)
+        values = (
+            transaction.date.toordinal(),
+            max(0, round(float(transaction.amount) * 100)),
+            INCOME if transaction.kind == "INCOME" else EXPENSE,
+            self._strings.intern(transaction.account),
+            self._strings.intern(transaction.category),
+            self._strings.intern(transaction.party or ""),
+            self._strings.intern(transaction.notes),
+            self._strings.intern(currency),
+        )
+        columns = (self._dates, self._cents, self._kinds, self._accountIds,
+                   self._categoryIds, self._partyIds, self._notesIds, self._currencyIds)
+        if previous is not None:
+            row = self._findRow(tid)
+            del self._order[self._orderPosition(row)]
+            for column, value in zip(columns, values):
+                column[row] = value
+        else:
+            row = len(self._dates)
+            for column, value in zip(columns, values):
+                column.append(value)
+            self._storeId(row, tid)
+            self._idHashes.append(hash(tid))
+            if 2 * (row + 1) > len(self._slots):
+                self._growSlots()
+            else:
+                self._insertSlot(self._idHashes[row], row)
+        order = self._order
+        # imports are mostly in date order, so check the tail before bisecting
+        if not order or self._dates[order[-1]] < self._dates[row]:
+            order.append(row)
+        else:
+            order.insert(self._orderPosition(row), row)
+        return ColumnarTransaction(self, row)
+
+    # the row stays behind as a tombstone, so the view handed out keeps its values
+    def _drop(self, stored):
+        del self._order[self._orderPosition(stored._row)]
+        self._removed.add(stored._row)
+
+    # the row is about to be overwritten, so keep a plain copy of it
+    def _detach(self, stored):
+        return stored.detach()
+
+    def _bounds(self, start, end):
+        key = self._dates.__getitem__
+        lo = 0 if start is None else bisect_left(self._order, start.toordinal(), key=key)
+        hi = len(self._order) if end is None else bisect_left(self._order, end.toordinal(), key=key)
+        return lo, hi
+
+    def _slice(self, lo, hi):
+        return [ColumnarTransaction(self, row) for row in self._order[lo:hi]]
+
+    # listRange one transaction at a time, for writers that shouldn't hold the whole range as a list
+    def iterRange(self, start, end):
+        lo, hi = self._bounds(start, end)
+        order = self._order
+        for i in range(lo, hi):
+            yield ColumnarTransaction(self, order[i])
+
+    # start <= date < end as parallel columns in (date, id) order: day ordinals, cents, income (1/0) and
+    # category/currency codes, label(code) gives the string back and idAt(i) the id of the i-th row.
+    # the columns are gathered straight from the arrays, no row views are built
+    def rangeColumns(self, start, end):
+        lo, hi = self._bounds(start, end)
+        rows = self._order[lo:hi]
+        gather = lambda column: array(column.typecode, map(column.__getitem__, rows))
+        return {
+            "days": gather(self._dates), "cents": gather(self._cents), "income": gather(self._kinds),
+            "category": gather(self._categoryIds), "currency": gather(self._currencyIds),
+            "label": self._strings.get, "idAt": lambda i: self._idAt(rows[i]),
+        }
+
+    def allTransactions(self):
+        return _AllTransactions(self)
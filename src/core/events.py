@@ -0,0 +1,52 @@
+import threading
+
+# event kinds
+ADDED = "added"
+UPDATED = "updated"
+REMOVED = "removed"
+ACCOUNT_ADDED = "accountAdded"
+# the whole ledger was swapped for another one (e.g. re-read after another process saved),
+# subscribers have to start over from ledger instead of applying a delta
+RELOADED = "reloaded"
+
+# one change to a ledger. transaction is the row as it is now (None once removed), previous the row
+# as it was (None when it's new), so a delta is always 'take previous out, put transaction in'
+class LedgerEvent:
+    __slots__ = ("kind", "transaction", "previous", "account", "ledger")
+
+    def __init__(self, kind, transaction=None, previous=None, account=None, ledger=None):
+        self.kind = kind
+        self.transaction = transaction
+        self.previous = previous
+        self.account = account
+        self.ledger = ledger
+
+# subscriber list behind Ledger.subscribe. callbacks run synchronously on the thread that made the
+# change, one that raises is reported and doesn't stop the others or the change itself
+class ChangeFeed:
+    def __init__(self):
+        self._subscribers = ()
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return bool(self._subscribers)
+
+    # returns a function that undoes the subscription
+    def subscribe(self, callback):
+        with self._lock:
+            self._subscribers = self._subscribers + (callback,)
+        return lambda: self.unsubscribe(callback)
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            subscribers = list(self._subscribers)
+            if callback in subscribers:
+                subscribers.remove(callback)
+            self._subscribers = tuple(subscribers)
+
+    def publish(self, event):
+        for callback in self._subscribers:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"[WARN] Change subscriber failed on {event.kind}: {e}")
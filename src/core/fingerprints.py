@@ -0,0 +1,52 @@
+import re
+
+_NOT_WORD = re.compile(r"[^0-9a-z]+")
+
+# 'ACME Corp.' and 'acme  corp' are the same counterparty
+def normalizeParty(party):
+    return _NOT_WORD.sub(" ", str(party or "").lower()).strip()
+
+# what a transaction looks like without its id: (date ordinal, account, signed cents, party)
+def fingerprint(transaction):
+    return (
+        transaction.date.toordinal(),
+        transaction.account,
+        round(transaction.effectiveAmount() * 100),
+        normalizeParty(transaction.party),
+    )
+
+# fingerprint -> ids of the transactions that have it, so a probable duplicate is a few dict lookups
+class FingerprintIndex:
+    def __init__(self):
+        self._ids = {}
+
+    def add(self, transaction):
+        self._ids.setdefault(fingerprint(transaction), []).append(transaction.id)
+
+    def remove(self, transaction):
+        key = fingerprint(transaction)
+        ids = self._ids.get(key)
+        if ids is None or transaction.id not in ids:
+            return
+        ids.remove(transaction.id)
+        if not ids:
+            del self._ids[key]
+
+    def rebuild(self, transactions):
+        self._ids = {}
+        for t in transactions:
+            self.add(t)
+
+    # id of a transaction that looks like this one within +-toleranceDays, closest date first.
+    # ids in `exclude` never match, imports use it so one stored row only absorbs one incoming row
+    def match(self, transaction, toleranceDays=0, exclude=()):
+        day, account, cents, party = fingerprint(transaction)
+        for offset in range(toleranceDays + 1):
+            for d in ((day,) if offset == 0 else (day - offset, day + offset)):
+                for tid in self._ids.get((d, account, cents, party), ()):
+                    if tid != transaction.id and tid not in exclude:
+                        return tid
+        return None
+
+    def __len__(self):
+        return sum(len(ids) for ids in self._ids.values())
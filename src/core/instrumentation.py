@@ -0,0 +1,163 @@
+import atexit
+import cProfile
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+# FINANCE_METRICS=1 turns spans and counters on, FINANCE_PROFILE=<span name> captures a cProfile
+# of the next run of that span into FINANCE_PROFILE_DIR (default: current directory)
+ENV_METRICS = "FINANCE_METRICS"
+ENV_PROFILE = "FINANCE_PROFILE"
+ENV_PROFILE_DIR = "FINANCE_PROFILE_DIR"
+# where installExitDump writes the registry as json, logged instead when unset
+ENV_METRICS_OUT = "FINANCE_METRICS_OUT"
+
+log = logging.getLogger("financeTracker.metrics")
+
+# per-name timings and counters, shared by the whole process
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spans = {}
+        self._counters = {}
+
+    def recordSpan(self, name, seconds, counters):
+        with self._lock:
+            s = self._spans.get(name)
+            if s is None:
+                s = self._spans[name] = {"calls": 0, "totalSeconds": 0.0, "maxSeconds": 0.0, "lastSeconds": 0.0, "counters": {}}
+            s["calls"] += 1
+            s["totalSeconds"] += seconds
+            s["lastSeconds"] = seconds
+            s["maxSeconds"] = max(s["maxSeconds"], seconds)
+            for key, n in counters.items():
+                s["counters"][key] = s["counters"].get(key, 0) + n
+
+    def increment(self, name, n=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "spans": {k: {**v, "counters": dict(v["counters"])} for k, v in self._spans.items()},
+                "counters": dict(self._counters),
+            }
+
+    def toJSON(self):
+        return json.dumps(self.snapshot(), indent=2, sort_keys=True)
+
+    def dump(self, path):
+        Path(path).write_text(self.toJSON())
+
+    def logSummary(self, logger=log):
+        snap = self.snapshot()
+        for name, s in sorted(snap["spans"].items()):
+            counters = " ".join(f"{k}={v}" for k, v in sorted(s["counters"].items()))
+            logger.info("%s calls=%d total=%.3fs max=%.3fs %s", name, s["calls"], s["totalSeconds"], s["maxSeconds"], counters)
+        for name, n in sorted(snap["counters"].items()):
+            logger.info("%s=%d", name, n)
+
+    def reset(self):
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+
+registry = MetricsRegistry()
+_enabled = os.environ.get(ENV_METRICS, "") not in ("", "0")
+_profileTarget = os.environ.get(ENV_PROFILE) or None
+
+def enable():
+    global _enabled
+    _enabled = True
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def isEnabled():
+    return _enabled
+
+# profile the next run of the named span
+def profileNext(name):
+    global _profileTarget
+    _profileTarget = name
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, counter, n=1):
+        pass
+
+_NOOP = _NoopSpan()
+
+class Span:
+    def __init__(self, name, counters):
+        self.name = name
+        self.counters = dict(counters)
+        self._profile = None
+
+    def add(self, counter, n=1):
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def __enter__(self):
+        global _profileTarget
+        if _profileTarget == self.name:
+            # only one capture per request, nested or concurrent runs go unprofiled
+            _profileTarget = None
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self._start
+        if self._profile is not None:
+            self._profile.disable()
+            out = Path(os.environ.get(ENV_PROFILE_DIR, ".")) / f"{self.name}-{int(time.time())}.prof"
+            self._profile.dump_stats(out)
+            log.info("profile of %s written to %s", self.name, out)
+        registry.recordSpan(self.name, elapsed, self.counters)
+        return False
+
+# `with span("repository.load") as s: ... s.add("rowsRead", n)`, free when metrics are off
+def span(name, **counters):
+    if not _enabled and _profileTarget != name:
+        return _NOOP
+    return Span(name, counters)
+
+def count(name, n=1):
+    if _enabled:
+        registry.increment(name, n)
+
+# dumps the registry when the process exits, if metrics are on
+def installExitDump():
+    def dumpNow():
+        if not _enabled:
+            return
+        out = os.environ.get(ENV_METRICS_OUT)
+        if out:
+            registry.dump(out)
+        else:
+            if not log.hasHandlers():
+                logging.basicConfig(level=logging.INFO)
+            registry.logSummary()
+    atexit.register(dumpNow)
+
+# decorator form of span for whole functions
+def timed(name):
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
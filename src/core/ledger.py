@@ -1,15 +1,56 @@
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter
 from datetime import date
-from .account import Account
+from itertools import zip_longest
+from .account import Account, DEFAULT_CURRENCY
+from .aggregates import MonthlyAggregates, monthKey
+from .fingerprints import FingerprintIndex
+from .balances import AccountBalances
+from .search import SearchIndex
+from .events import ChangeFeed, LedgerEvent, ADDED, UPDATED, REMOVED, ACCOUNT_ADDED
+from .instrumentation import span
 
-class Ledger:
+# first day of the month and first day of the month after, for 'YYYY-MM'
+def monthBounds(month):
+    try:
+        y_str, m_str = month.strip().split("-", 1)
+        year, mon = int(y_str), int(m_str)
+    except ValueError:
+        raise ValueError(f"month must be 'YYYY-MM', not {month!r}") from None
+    if not (1 <= mon <= 12):
+        raise ValueError("month must be 'YYYY-MM'")
+    start = date(year, mon, 1)
+    end = date(year + 1, 1, 1) if mon == 12 else date(year, mon + 1, 1)
+    return start, end
+
+# index, aggregate and event bookkeeping shared by Ledger and ColumnarLedger. subclasses only store
+# rows: _find(id), _put(transaction, currency, previous), _drop(stored), _detach(stored), _bounds(start, end),
+# _slice(lo, hi), iterRange, allTransactions and rangeColumns
+class LedgerBase:
     def __init__(self):
         self._accounts = {}
-        self._transactions = {}
+        # month and (month, category) totals kept up to date on every add
+        self._monthly = MonthlyAggregates()
+        # 'YYYY-MM' keys touched since the last markClean, partitioned storage only rewrites these
+        self._dirty = set()
+        # running balance per account by date
+        self._balances = AccountBalances()
+        # (date, account, cents, party) index for duplicate checks, built on first use then kept up to date
+        self._fingerprints = None
+        # token and field indexes behind search(), also built on first use
+        self._search = None
+        # subscribers told about every change, see subscribe()
+        self._feed = ChangeFeed()
+        # how many transactions are in each currency
+        self._currencies = Counter()
 
     # Accounts
     def addAccount(self, account):
         if account.name not in self._accounts:
             self._accounts[account.name] = account
+            if self._feed:
+                self._feed.publish(LedgerEvent(ACCOUNT_ADDED, account=account))
 
     def getAccount(self, name):
         return self._accounts.get(name)
@@ -18,29 +59,251 @@ class Ledger:
         return list(self._accounts.values())
 
     # Transactions
+    # the same id again replaces the stored transaction. a transaction without a currency gets its account's
     def addTransaction(self, transaction):
         if transaction.account not in self._accounts:
             print("shit gone bad")
-        self._transactions[transaction.id] = transaction
+        currency = transaction.currency
+        if currency is None:
+            account = self._accounts.get(transaction.account)
+            currency = account.currency if account else DEFAULT_CURRENCY
+        previous = self._find(transaction.id)
+        if previous is not None:
+            self._unindex(previous)
+            # subscribers get what the row was, even when the storage overwrites it in place
+            if self._feed:
+                previous = self._detach(previous)
+        stored = self._put(transaction, currency, previous)
+        self._index(stored)
+        if self._feed:
+            self._feed.publish(LedgerEvent(ADDED if previous is None else UPDATED, stored, previous))
+
+    # takes a transaction out of the ledger and every index, returns it (None if the id is unknown)
+    def removeTransaction(self, transactionID):
+        previous = self._find(transactionID)
+        if previous is None:
+            return None
+        self._unindex(previous)
+        self._drop(previous)
+        if self._feed:
+            self._feed.publish(LedgerEvent(REMOVED, previous=previous))
+        return previous
+
+    def _index(self, t):
+        self._monthly.add(t)
+        self._balances.add(t)
+        self._currencies[t.currency] += 1
+        self._dirty.add(monthKey(t.date))
+        if self._fingerprints is not None:
+            self._fingerprints.add(t)
+        if self._search is not None:
+            self._search.add(t)
+
+    def _unindex(self, t):
+        self._monthly.remove(t)
+        self._balances.remove(t)
+        self._currencies[t.currency] -= 1
+        self._dirty.add(monthKey(t.date))
+        if self._fingerprints is not None:
+            self._fingerprints.remove(t)
+        if self._search is not None:
+            self._search.remove(t)
+
+    # callback(LedgerEvent) after every change, on the thread that made it. returns a function
+    # that unsubscribes. nothing is published (or built for it) while nobody listens
+    def subscribe(self, callback):
+        return self._feed.subscribe(callback)
 
     def getTransaction(self, transactionID):
-        return self._transactions.get(transactionID)
+        return self._find(transactionID)
 
     # lists the transactions based on the month so u can get monthly report
     def listTransactions(self, month):
-        year = mon = None
-        if month:
-            y_str, m_str = month.strip().split("-", 1)
-            year, mon = int(y_str), int(m_str)
-            if not (1 <= mon <= 12):
-                raise ValueError("month must be 'YYYY-MM'")
-
-        txs = [
-            t for t in self._transactions.values()
-            if (year is None or (t.date.year == year and t.date.month == mon))
-        ]
-        txs.sort(key=lambda t: (t.date, t.id))
-        return txs
-    
+        if not month:
+            return self.listRange(None, None)
+        return self.listRange(*monthBounds(month))
+
+    # transactions with start <= date < end ordered by (date, id), None leaves that side open
+    def listRange(self, start, end):
+        with span("ledger.listRange") as s:
+            lo, hi = self._bounds(start, end)
+            s.add("rows", hi - lo)
+            return self._slice(lo, hi)
+
+    # how many transactions listRange(start, end) would return, without building the list
+    def countRange(self, start, end):
+        lo, hi = self._bounds(start, end)
+        return hi - lo
+
+    # currencies the transactions are in
+    def currencies(self):
+        return sorted(c for c, n in self._currencies.items() if n)
+
+    # O(1) month totals from the maintained aggregates
+    def monthlyTotals(self, month):
+        key = monthKey(monthBounds(month)[0])
+        return self._monthly.month(key, lambda: self.listTransactions(key))
+
+    def aggregateRecords(self):
+        return self._monthly.records()
+
+    # 'YYYY-MM' keys that have transactions
+    def months(self):
+        return [key for key, month in sorted(self._monthly.byMonth().items()) if month.categories]
+
+    # balance of an account at the end of as_of (a date, or a 'YYYY-MM-DD' string), None for the latest
+    def balance(self, account, as_of=None):
+        if account not in self._accounts:
+            raise ValueError(f"Unknown account: {account}")
+        if isinstance(as_of, str):
+            as_of = date.fromisoformat(as_of)
+        return self._balances.balance(account, as_of)
+
+    # (date, balance at the end of that date) for each day the account moved, start <= date < end
+    def balanceHistory(self, account, start=None, end=None):
+        if account not in self._accounts:
+            raise ValueError(f"Unknown account: {account}")
+        return self._balances.history(account, start, end)
+
+    # every account's balance at the end of as_of
+    def balances(self, as_of=None):
+        return {name: self.balance(name, as_of) for name in self._accounts}
+
+    # transactions matching every given predicate with start <= date < end, ordered by (date, id).
+    # text words are looked up in notes and party, account/category/kind ("INCOME"/"EXPENSE") match exactly
+    def search(self, text=None, account=None, category=None, kind=None, start=None, end=None, limit=None):
+        return self.searchIndex().search(self, text, account, category, kind, start, end, limit)
+
+    def searchIndex(self):
+        if self._search is None:
+            self._search = SearchIndex()
+            self._search.rebuild(self.allTransactions())
+        return self._search
+
+    def fingerprints(self):
+        if self._fingerprints is None:
+            self._fingerprints = FingerprintIndex()
+            self._fingerprints.rebuild(self.allTransactions())
+        return self._fingerprints
+
+    def dirtyMonths(self):
+        return sorted(self._dirty)
+
+    def markClean(self):
+        self._dirty.clear()
+
+    # full recompute, for after bulk loads or when checking integrity
+    def rebuildAggregates(self):
+        self._monthly.rebuild(self.allTransactions())
+
+# rows from the end of the date order within which Ledger keeps its rangeColumns arrays up to date,
+# a change further back drops them and the next rangeColumns rebuilds them in one pass
+COLUMN_SHIFT_LIMIT = 4096
+
+# transactions kept as the objects they were added as, in a dict by id
+class Ledger(LedgerBase):
+    def __init__(self):
+        super().__init__()
+        self._transactions = {}
+        # (date, id) keys kept sorted so date windows are a bisect plus slice
+        self._byDate = []
+        # rangeColumns as arrays in _byDate order (days, cents, income, category, currency), so a window
+        # is a slice of each. None until first asked for and after a back-dated change, so bulk loads
+        # in any order never pay for shifting them
+        self._columns = None
+        # category and currency strings -> codes for those columns, codes are never reused
+        self._codes = {}
+        self._labels = []
+
+    def _code(self, label):
+        code = self._codes.get(label)
+        if code is None:
+            code = self._codes[label] = len(self._labels)
+            self._labels.append(label)
+        return code
+
+    def _columnValues(self, t):
+        # by kind like ColumnarLedger stores it, a zero income is still income
+        return (t.date.toordinal(), round(t.amount * 100), t.kind == "INCOME", self._code(t.category),
+                self._code(t.currency))
+
+    def _buildColumns(self):
+        txs = self._transactions
+        columns = zip(*(self._columnValues(txs[tid]) for _, tid in self._byDate))
+        self._columns = tuple(array(typecode, column) for typecode, column in zip_longest("iqbii", columns, fillvalue=()))
+
+    def _insertRow(self, t):
+        key = (t.date, t.id)
+        insort(self._byDate, key)
+        if self._columns is not None:
+            i = bisect_left(self._byDate, key)
+            if len(self._byDate) - i > COLUMN_SHIFT_LIMIT:
+                self._columns = None
+            else:
+                for column, value in zip(self._columns, self._columnValues(t)):
+                    column.insert(i, value)
+
+    def _removeRow(self, t):
+        i = bisect_left(self._byDate, (t.date, t.id))
+        self._byDate.pop(i)
+        if self._columns is not None:
+            if len(self._byDate) - i > COLUMN_SHIFT_LIMIT:
+                self._columns = None
+            else:
+                for column in self._columns:
+                    del column[i]
+
+    def _find(self, transactionID):
+        return self._transactions.get(transactionID)
+
+    def _put(self, transaction, currency, previous):
+        if previous is not None:
+            self._removeRow(previous)
+        if transaction.currency is None:
+            transaction.currency = currency
+        self._transactions[transaction.id] = transaction
+        self._insertRow(transaction)
+        return transaction
+
+    def _drop(self, stored):
+        del self._transactions[stored.id]
+        self._removeRow(stored)
+
+    # replacing never changes the stored object, it's swapped for the new one
+    def _detach(self, stored):
+        return stored
+
+    def _bounds(self, start, end):
+        lo = 0 if start is None else bisect_left(self._byDate, (start,))
+        hi = len(self._byDate) if end is None else bisect_left(self._byDate, (end,))
+        return lo, hi
+
+    def _slice(self, lo, hi):
+        txs = self._transactions
+        return [txs[tid] for _, tid in self._byDate[lo:hi]]
+
+    # listRange one transaction at a time, for writers that shouldn't hold the whole range as a list
+    def iterRange(self, start, end):
+        lo, hi = self._bounds(start, end)
+        byDate, txs = self._byDate, self._transactions
+        for i in range(lo, hi):
+            yield txs[byDate[i][1]]
+
+    # start <= date < end as parallel columns in (date, id) order: day ordinals, cents, income (1/0) and
+    # category/currency codes, label(code) gives the string back and idAt(i) the id of the i-th row.
+    # for converting a whole window in one go instead of one transaction at a time, the columns are
+    # slices (copies, a memcpy each) of the maintained arrays. not memoryviews, those would stop the
+    # arrays from growing while a caller still holds them
+    def rangeColumns(self, start, end):
+        lo, hi = self._bounds(start, end)
+        keys = self._byDate[lo:hi]
+        if self._columns is None:
+            self._buildColumns()
+        days, cents, income, categories, currencies = (column[lo:hi] for column in self._columns)
+        return {
+            "days": days, "cents": cents, "income": income, "category": categories, "currency": currencies,
+            "label": self._labels.__getitem__, "idAt": lambda i: keys[i][1],
+        }
+
     def allTransactions(self):
         return self._transactions.values()
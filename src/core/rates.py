@@ -0,0 +1,69 @@
+import csv
+from bisect import bisect_right
+from datetime import date
+from functools import lru_cache
+
+from .account import DEFAULT_CURRENCY
+
+# exchange rates read from a local file, no network. a rate is how many DEFAULT_CURRENCY one unit of
+# the currency was worth, the rate on a date is the latest one published on or before it
+class RateTable:
+    def __init__(self, rates=None, cacheSize=4096):
+        # currency -> (sorted day ordinals, rates on those days)
+        self._days = {}
+        self._rates = {}
+        for currency, entries in (rates or {}).items():
+            self.setRates(currency, entries)
+        # (currency, date) -> rate for the one-at-a-time callers (live summaries, single rows)
+        self.rate = lru_cache(maxsize=cacheSize)(self._lookup)
+
+    # 'date,currency,rate' csv, one line per published rate
+    @classmethod
+    def fromCsv(cls, path, cacheSize=4096):
+        rates = {}
+        with open(path, newline="", encoding="utf-8") as f:
+            for line, r in enumerate(csv.DictReader(f), 2):
+                try:
+                    d = date.fromisoformat(r["date"].strip())
+                    currency = r["currency"].strip().upper()
+                    rate = float(r["rate"])
+                except (KeyError, AttributeError, TypeError, ValueError) as e:
+                    raise ValueError(f"{path}, line {line}: bad rate row ({e})")
+                if rate <= 0:
+                    raise ValueError(f"{path}, line {line}: rate must be positive")
+                rates.setdefault(currency, []).append((d, rate))
+        return cls(rates, cacheSize)
+
+    # replaces everything known about currency with (date, rate) pairs
+    def setRates(self, currency, entries):
+        entries = sorted(entries)
+        self._days[currency] = [d.toordinal() for d, _ in entries]
+        self._rates[currency] = [rate for _, rate in entries]
+        if hasattr(self, "rate"):
+            self.rate.cache_clear()
+
+    def currencies(self):
+        return sorted(self._days)
+
+    def _lookup(self, currency, on):
+        if currency == DEFAULT_CURRENCY:
+            return 1.0
+        days = self._days.get(currency)
+        i = bisect_right(days, on.toordinal()) if days else 0
+        if i == 0:
+            raise ValueError(f"No {currency} rate on or before {on.isoformat()}")
+        return self._rates[currency][i - 1]
+
+    # rate for every day ordinal in days (a numpy array) in one searchsorted, for converting whole windows
+    def factors(self, currency, days):
+        import numpy as np
+        if currency == DEFAULT_CURRENCY:
+            return np.ones(len(days))
+        known = self._days.get(currency)
+        if not known:
+            raise ValueError(f"No {currency} rates")
+        i = np.searchsorted(np.asarray(known), days, side="right")
+        if len(i) and i.min() == 0:
+            first = date.fromordinal(int(days[i == 0].min()))
+            raise ValueError(f"No {currency} rate on or before {first.isoformat()}")
+        return np.asarray(self._rates[currency])[i - 1]
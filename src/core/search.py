@@ -0,0 +1,158 @@
+import re
+from bisect import bisect_left
+from itertools import islice
+
+_TOKEN = re.compile(r"[0-9a-z]+")
+# field:value terms understood by parseQuery, everything else is free text
+QUERY_FIELDS = ("account", "category", "type")
+
+def tokenize(text):
+    return _TOKEN.findall(str(text or "").lower())
+
+# 'hydro account:chequing type:expense' -> {"text": "hydro", "account": "chequing", "kind": "EXPENSE"}
+def parseQuery(query):
+    spec, words = {}, []
+    for word in str(query or "").split():
+        field, sep, value = word.partition(":")
+        if sep and field.lower() in QUERY_FIELDS and value:
+            if field.lower() == "type":
+                spec["kind"] = value.upper()
+            else:
+                spec[field.lower()] = value
+        else:
+            words.append(word)
+    if words:
+        spec["text"] = " ".join(words)
+    return spec
+
+# whether one transaction is something SearchIndex.search would return for these predicates,
+# for checking a single changed row without going through the index
+def matchesQuery(transaction, text=None, account=None, category=None, kind=None):
+    if account and transaction.account.lower() != account.lower():
+        return False
+    if category and transaction.category.lower() != category.lower():
+        return False
+    if kind and transaction.kind != kind.upper():
+        return False
+    words = tokenize(text)
+    if not words:
+        return True
+    tokens = set(tokenize(transaction.notes)) | set(tokenize(transaction.party))
+    if any(word not in tokens for word in words[:-1]):
+        return False
+    return any(token.startswith(words[-1]) for token in tokens)
+
+# inverted index over the words in notes and party, plus exact indexes on account, category and type.
+# every index maps to sets of transaction ids, a query intersects them smallest first
+class SearchIndex:
+    def __init__(self):
+        self._tokens = {}
+        self._accounts = {}
+        self._categories = {}
+        self._kinds = {}
+        # tokens in order for prefix lookups, rebuilt on the next search after a new token shows up
+        self._sortedTokens = None
+
+    def _keys(self, transaction):
+        tokens = set(tokenize(transaction.notes)) | set(tokenize(transaction.party))
+        return tokens, (
+            (self._accounts, transaction.account.lower()),
+            (self._categories, transaction.category.lower()),
+            (self._kinds, transaction.kind),
+        )
+
+    def add(self, transaction):
+        tid = transaction.id
+        tokens, exact = self._keys(transaction)
+        for token in tokens:
+            ids = self._tokens.get(token)
+            if ids is None:
+                ids = self._tokens[token] = set()
+                self._sortedTokens = None
+            ids.add(tid)
+        for index, key in exact:
+            index.setdefault(key, set()).add(tid)
+
+    def remove(self, transaction):
+        tid = transaction.id
+        tokens, exact = self._keys(transaction)
+        for index, key in [(self._tokens, token) for token in tokens] + list(exact):
+            ids = index.get(key)
+            if ids is None:
+                continue
+            ids.discard(tid)
+            if not ids:
+                del index[key]
+                if index is self._tokens:
+                    self._sortedTokens = None
+
+    def rebuild(self, transactions):
+        for index in (self._tokens, self._accounts, self._categories, self._kinds):
+            index.clear()
+        self._sortedTokens = None
+        for t in transactions:
+            self.add(t)
+
+    # sets of ids for every token starting with prefix
+    def _prefixed(self, prefix):
+        if self._sortedTokens is None:
+            self._sortedTokens = sorted(self._tokens)
+        tokens = self._sortedTokens
+        i = bisect_left(tokens, prefix)
+        sets = []
+        while i < len(tokens) and tokens[i].startswith(prefix):
+            sets.append(self._tokens[tokens[i]])
+            i += 1
+        return sets
+
+    # one id set per predicate, a row has to be in all of them. None when there's no predicate at all.
+    # every word of text has to appear in notes or party, the last one may be a prefix (search as you type)
+    def _predicateSets(self, text, account, category, kind):
+        sets = []
+        for index, key in ((self._accounts, account), (self._categories, category), (self._kinds, kind)):
+            if key:
+                sets.append(index.get(key.upper() if index is self._kinds else key.lower(), set()))
+        words = tokenize(text)
+        for word in words[:-1]:
+            sets.append(self._tokens.get(word, set()))
+        if not sets and not words:
+            return None
+        if words and not any(not s for s in sets):
+            prefixed = self._prefixed(words[-1])
+            sets.append(prefixed[0] if len(prefixed) == 1 else set().union(*prefixed))
+        sets.sort(key=len)
+        return sets
+
+    def candidates(self, text=None, account=None, category=None, kind=None):
+        sets = self._predicateSets(text, account, category, kind)
+        if sets is None:
+            return None
+        result = set(sets[0])
+        for s in sets[1:]:
+            if not result:
+                break
+            result &= s
+        return result
+
+    # matching transactions with start <= date < end, ordered by (date, id)
+    def search(self, ledger, text=None, account=None, category=None, kind=None, start=None, end=None, limit=None):
+        sets = self._predicateSets(text, account, category, kind)
+        if sets is None:
+            txs = ledger.listRange(start, end)
+            return txs if limit is None else txs[:limit]
+        if not sets[0]:
+            return []
+        if 8 * len(sets[0]) > ledger.countRange(start, end):
+            # broad predicates or a narrow date window: walk the date index and test membership,
+            # which is already in order and never copies the big sets
+            if len(sets) == 1:
+                member = sets[0].__contains__
+            else:
+                member = lambda tid: all(tid in s for s in sets)
+            matches = (t for t in ledger.listRange(start, end) if member(t.id))
+            return list(matches) if limit is None else list(islice(matches, limit))
+        ids = self.candidates(text, account, category, kind)
+        txs = [ledger.getTransaction(tid) for tid in ids]
+        txs = [t for t in txs if (start is None or t.date >= start) and (end is None or t.date < end)]
+        txs.sort(key=lambda t: (t.date, t.id))
+        return txs if limit is None else txs[:limit]
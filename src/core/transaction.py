@@ -2,7 +2,10 @@ from datetime import date, datetime
 from abc import ABC, abstractmethod
 from uuid import uuid4
 
-from .account import Account
+from .account import Account, DEFAULT_CURRENCY
+
+# column order of record() and row(), which is also the order storage writes them in
+RECORD_COLUMNS = ("id", "date", "account", "category", "type", "amount", "notes", "payor", "payee", "currency")
 
 # to make sure a date is returned and parsed into one if not a date
 def _parse_date(s):
@@ -11,10 +14,11 @@ def _parse_date(s):
     return datetime.fromisoformat(str(s)).date()
 
 class Transaction(ABC):
-    defaultCurrency = "CAD"
+    defaultCurrency = DEFAULT_CURRENCY
     baseTax = 1.13
 
-    def __init__ (self, id, date, account, category, amount, notes):
+    # currency None means the account's, a ledger fills it in when the transaction is added
+    def __init__ (self, id, date, account, category, amount, notes, currency=None):
         self.id = id
         self.date = date
         self.account = account
@@ -22,6 +26,7 @@ class Transaction(ABC):
         self._amount = 0.0
         self.amount = amount
         self.notes = notes
+        self.currency = currency or None
         
     @property
     def amount(self):
@@ -39,20 +44,23 @@ class Transaction(ABC):
     def getInformation(self): ...
     @abstractmethod
     def record(self): ...
+    # record() as a tuple in RECORD_COLUMNS order, for writers that stream rows
+    @abstractmethod
+    def row(self): ...
 
     # returns correct class 
     @classmethod
-    def create(cls, *, kind, id, date, account, category, amount, notes="", payor=None, payee=None):
+    def create(cls, *, kind, id, date, account, category, amount, notes="", payor=None, payee=None, currency=None):
 
         k = str(kind).upper()
         if k == "INCOME":
             if payor is None:
                 raise ValueError("payor is required for INCOME")
-            return Income(id, _parse_date(date), account, category, amount, payor, notes)
+            return Income(id, _parse_date(date), account, category, amount, payor, notes, currency)
         elif k == "EXPENSE":
             if payee is None:
                 raise ValueError("payee is required for EXPENSE")
-            return Expense(id, _parse_date(date), account, category, amount, payee, notes)
+            return Expense(id, _parse_date(date), account, category, amount, payee, notes, currency)
         else:
             raise ValueError(f"Unknown kind: {kind!r}")
 
@@ -62,11 +70,9 @@ class Transaction(ABC):
         if not ledger.getAccount(account):
             ledger.addAccount(Account(account))
 
-    # load excel and create transaction income
+    # create transaction income and hand it to the repo
     @classmethod
-    def recordIncome(cls, repo, *, date, account, category, amount, payor, notes=""):
-        ledger = repo.load()
-        cls.ensureAccount(ledger, account)
+    def recordIncome(cls, repo, *, date, account, category, amount, payor, notes="", currency=None):
         transaction = cls.create(
             kind="INCOME",
             id=str(uuid4()),
@@ -76,16 +82,14 @@ class Transaction(ABC):
             amount=float(amount),
             notes=notes,
             payor=payor,
+            currency=currency,
         )
-        ledger.addTransaction(transaction)
-        repo.save(ledger)
+        repo.appendTransaction(transaction)
         return transaction.id
 
-    # load excel and create transaction expense
+    # create transaction expense and hand it to the repo
     @classmethod
-    def recordExpense(cls, repo, *, date, account, category, amount, payee, notes=""):
-        ledger = repo.load()
-        cls.ensureAccount(ledger, account)
+    def recordExpense(cls, repo, *, date, account, category, amount, payee, notes="", currency=None):
         transaction = cls.create(
             kind="EXPENSE",
             id=str(uuid4()),
@@ -95,14 +99,52 @@ class Transaction(ABC):
             amount=float(amount),
             notes=notes,
             payee=payee,
+            currency=currency,
         )
-        ledger.addTransaction(transaction)
-        repo.save(ledger)
+        repo.appendTransaction(transaction)
         return transaction.id
 
+    # new transaction with a fresh id from a {"kind", "date", "account", ...} spec, nothing is written
+    @classmethod
+    def fromSpec(cls, spec):
+        return cls.create(
+            kind=spec["kind"],
+            id=str(uuid4()),
+            date=spec["date"],
+            account=spec["account"],
+            category=spec.get("category", ""),
+            amount=float(spec["amount"]),
+            notes=spec.get("notes", ""),
+            payor=spec.get("payor"),
+            payee=spec.get("payee"),
+            currency=spec.get("currency"),
+        )
+
+    # posts a batch of {"kind", "date", "account", "category", "amount", "payor"/"payee", "notes"} specs.
+    # every spec is checked before anything is written, then the repo commits them in one go
+    @classmethod
+    def recordMany(cls, repo, entries):
+        transactions = []
+        errors = []
+        for i, entry in enumerate(entries):
+            try:
+                transactions.append(cls.fromSpec(entry))
+            except KeyError as e:
+                errors.append(f"entry {i}: missing {e.args[0]!r}")
+            except (TypeError, ValueError) as e:
+                errors.append(f"entry {i}: {e}")
+        if errors:
+            raise ValueError(f"{len(errors)} invalid entries:\n" + "\n".join(errors))
+        if transactions:
+            repo.appendTransactions(transactions)
+        return [t.id for t in transactions]
+
 class Income (Transaction):
-    def __init__ (self, id, date, account, category, amount, payor, notes):
-        super().__init__(id, date, account, category, amount, notes)
+    # the "type" column, what search and reports go by rather than the sign of the amount
+    kind = "INCOME"
+
+    def __init__ (self, id, date, account, category, amount, payor, notes, currency=None):
+        super().__init__(id, date, account, category, amount, notes, currency)
         self.payor = payor
 
     @property
@@ -124,12 +166,18 @@ class Income (Transaction):
             "notes": self.notes,
             "payor": self.payor,
             "payee": "",
+            "currency": self.currency or "",
         }
+    def row(self):
+        return (self.id, self.date.isoformat(), self.account, self.category, "INCOME", float(self.amount), self.notes,
+                self.payor, "", self.currency or "")
 
 
 class Expense (Transaction):
-    def __init__ (self, id, date, account, category, amount, payee, notes):
-        super().__init__(id, date, account, category, amount, notes)
+    kind = "EXPENSE"
+
+    def __init__ (self, id, date, account, category, amount, payee, notes, currency=None):
+        super().__init__(id, date, account, category, amount, notes, currency)
         self.payee = payee
     
     @property
@@ -151,4 +199,8 @@ class Expense (Transaction):
             "notes": self.notes,
             "payor": "",         
             "payee": self.payee,
+            "currency": self.currency or "",
         }
+    def row(self):
+        return (self.id, self.date.isoformat(), self.account, self.category, "EXPENSE", float(self.amount), self.notes,
+                "", self.payee, self.currency or "")
@@ -1,25 +1,48 @@
 import sys
+import threading
 from pathlib import Path
-PKG_ROOT = Path(__file__).resolve().parents[1]
-PROJECT_ROOT = PKG_ROOT.parent
-if str(PROJECT_ROOT) not in sys.path:
-    sys.path.insert(0, str(PROJECT_ROOT))
 
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QGridLayout, QLabel, QLineEdit, QComboBox,
-    QPushButton, QTableWidget, QTableWidgetItem, QHeaderView, QFileDialog,
-    QMessageBox, QHBoxLayout, QVBoxLayout, QSizePolicy
+    QPushButton, QTableView, QAbstractItemView, QHeaderView, QFileDialog,
+    QMessageBox, QHBoxLayout, QVBoxLayout, QSizePolicy, QProgressDialog
 )
 from PyQt5.QtCore import Qt, QTimer
 
-from src.core.transaction import Transaction
+from core.ledger import monthBounds
+from core.events import LedgerEvent, RELOADED
+from core.search import parseQuery, matchesQuery
+from core.transaction import Transaction
+from services.reporting import LiveMonthSummary, LiveBalances
+from interface.tasks import TaskRunner, SaveCoalescer, ChangeQueue
+from interface.transactionModel import TransactionTableModel
 
 class FinanceWindow(QWidget):
     def __init__(self, repo, rpsvc):
         super().__init__()
         self.repo = repo
         self.rpsvc = rpsvc
+        # repository and reporting calls run here so the window never blocks on workbook i/o
+        self.tasks = TaskRunner()
+        # adds clicked in quick succession are written as one batch
+        self.pendingAdds = SaveCoalescer(
+            self.tasks, self.repo.appendTransactions,
+            onCommitted=self.transactionsAdded, onError=self.error,
+        )
+        # what the table currently shows: (start, end, search spec), None before anything is shown
+        self.view = None
+        self.monthSummary = None
+        self.liveBalances = LiveBalances({})
+        self.refreshesPending = 0
         self.buildUI()
+        # adds and imports come back as change events from the ledger the window last loaded and only
+        # the changed rows are applied, see followLedger
+        self.changes = ChangeQueue(self.applyChanges, self)
+        self.ledger = None
+        self.unfollow = None
+        self.ledgerLock = threading.Lock()
+        # fills in the balances, and the table once a month is entered
+        self.refreshTable()
 
     def buildUI(self):
         self.setWindowTitle("Finance Tracker!!!!!!!!!!!!!!!!!!!!!")
@@ -77,9 +100,17 @@ class FinanceWindow(QWidget):
 
         bottomRow.addLayout(bottomRight)
 
-        # displaying transactions table
-        self.table = QTableWidget(0, 7)
-        self.table.setHorizontalHeaderLabels(["Date", "Account", "Category", "Party", "Type", "Amount", "Notes"])
+        # displaying transactions table, the view only renders the rows on screen. header clicks go
+        # straight to the model's sort and search results come from the ledger, so there's no proxy
+        self.model = TransactionTableModel(self)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSortingEnabled(True)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        # fixed row heights so the view never measures rows it isn't showing
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.verticalHeader().setVisible(False)
         header = self.table.horizontalHeader()
         header.setSectionResizeMode(QHeaderView.Stretch)
         header.setSectionResizeMode(0, QHeaderView.ResizeToContents)
@@ -87,6 +118,24 @@ class FinanceWindow(QWidget):
         header.setSectionResizeMode(4, QHeaderView.ResizeToContents)
         header.setSectionResizeMode(5, QHeaderView.ResizeToContents)
 
+        # searches the ledger's indexes (the entered month only, if there is one), runs once typing pauses
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText("Search notes and parties, e.g. hydro one account:chequing type:expense")
+        self.searchTimer = QTimer(self)
+        self.searchTimer.setSingleShot(True)
+        self.searchTimer.setInterval(200)
+        self.searchTimer.timeout.connect(self.refreshTable)
+        self.filter_edit.textChanged.connect(lambda _: self.searchTimer.start())
+
+        # current balance per account, straight from the ledger's running totals
+        self.balance_label = QLabel("")
+        self.balance_label.setStyleSheet("color: #444; padding: 4px;")
+        self.balance_label.setWordWrap(True)
+
+        # totals of the month shown in the table, kept current as transactions come in
+        self.month_summary_label = QLabel("")
+        self.month_summary_label.setStyleSheet("color: #444; padding: 4px;")
+
         #bottom confirmation label
         self.status_label = QLabel(""); self.status_label.setAlignment(Qt.AlignLeft)
         self.status_label.setStyleSheet("color: #444; padding: 4px;")
@@ -94,7 +143,10 @@ class FinanceWindow(QWidget):
         #add all onto root
         root.addLayout(grid)
         root.addLayout(bottomRow)
+        root.addWidget(self.filter_edit)
         root.addWidget(self.table)
+        root.addWidget(self.month_summary_label)
+        root.addWidget(self.balance_label)
         root.addWidget(self.status_label)
 
         self.add_btn.clicked.connect(self.addTransaction)
@@ -102,67 +154,103 @@ class FinanceWindow(QWidget):
         self.summary_btn.clicked.connect(self.summarizeTable)
         self.export_btn.clicked.connect(self.exportExcel)
 
-    # creates a transaction and adds it
+    # creates a transaction and queues it, the write happens in the background
     def addTransaction(self):
         try:
-            if self.type_combo.currentText().upper() == "INCOME":
-                tx_id = Transaction.recordIncome(
-                    self.repo,
-                    date=self.date_edit.text().strip(),
-                    account=self.account_edit.text().strip(),
-                    category=self.category_edit.text().strip(),
-                    amount=float(self.amount_edit.text()),
-                    payor=(self.counterparty_edit.text().strip() if hasattr(self, "counterparty_edit")
-                        else self.party_edit.text().strip()),
-                    notes=self.notes_edit.text().strip(),
-                )
-            else:
-                tx_id = Transaction.recordExpense(
-                    self.repo,
-                    date=self.date_edit.text().strip(),
-                    account=self.account_edit.text().strip(),
-                    category=self.category_edit.text().strip(),
-                    amount=float(self.amount_edit.text()),
-                    payee=(self.counterparty_edit.text().strip() if hasattr(self, "counterparty_edit")
-                        else self.party_edit.text().strip()),
-                    notes=self.notes_edit.text().strip(),
-                )
-            self.displayConfirmation(f" Added transaction {tx_id[:8]}")
-            self.refreshTable()
+            kind = self.type_combo.currentText().upper()
+            party = (self.counterparty_edit.text().strip() if hasattr(self, "counterparty_edit")
+                else self.party_edit.text().strip())
+            transaction = Transaction.fromSpec({
+                "kind": kind,
+                "date": self.date_edit.text().strip(),
+                "account": self.account_edit.text().strip(),
+                "category": self.category_edit.text().strip(),
+                "amount": float(self.amount_edit.text()),
+                "payor": party if kind == "INCOME" else None,
+                "payee": party if kind == "EXPENSE" else None,
+                "notes": self.notes_edit.text().strip(),
+            })
+            self.pendingAdds.add(transaction)
         except Exception as e:
             self.error(str(e))
 
+    def transactionsAdded(self, batch):
+        if len(batch) == 1:
+            self.displayConfirmation(f" Added transaction {batch[0].id[:8]}")
+        else:
+            self.displayConfirmation(f" Added {len(batch)} transactions")
+        self.syncLedger()
+
     # def importExcel(self):
     #     pass
     def importExcel(self):
-        path, _ = QFileDialog.getOpenFileName(self, "Choose Excel file", filter="Excel (*.xlsx)")
-        if not path: return
-        try:
-            ledger = self.repo.load()
-            n = self.repo.importTransactions(path, ledger)
-            self.repo.save(ledger)
-            self.displayConfirmation(f"Imported {n} transactions.")
-            self.refreshTable()
-        except Exception as e:
-            self.error(str(e))
+        paths, _ = QFileDialog.getOpenFileNames(self, "Choose Excel or CSV files", filter="Spreadsheets (*.xlsx *.csv)")
+        if not paths: return
+        # anything still queued goes in before the import so ids dedupe against it
+        self.pendingAdds.flush()
+        if len(paths) > 1:
+            self.importMany(paths); return
+        path = paths[0]
+        progress = QProgressDialog("Importing...", "Cancel", 0, 0, self)
+        progress.setWindowTitle("Import")
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setMinimumDuration(500)
+
+        def done(result):
+            progress.close()
+            flagged = f", {len(result.duplicates)} look like duplicates" if result.duplicates else ""
+            if task.cancelled:
+                self.displayConfirmation(f"Import cancelled, {result.added} transactions imported{flagged}.")
+            else:
+                self.displayConfirmation(f"Imported {result.added} transactions{flagged}.")
+            self.syncLedger()
+
+        def failed(msg):
+            progress.close()
+            self.error(msg)
+
+        task = self.tasks.run(
+            self.repo.importFile, path, onDone=done, onError=failed, label="import",
+            onProgress=lambda read, added: progress.setLabelText(f"Read {read} rows, {added} new"),
+        )
+        progress.canceled.connect(task.cancel)
+
+    # several exports at once, parsed in parallel and saved once
+    def importMany(self, paths):
+        def done(result):
+            lines = [
+                f"{Path(f.path).name}: {f.added} new, {f.knownIds} already known, {len(f.duplicates)} look like duplicates" if f.ok
+                else f"{Path(f.path).name}: not imported ({f.error.splitlines()[0]})"
+                for f in result.files
+            ]
+            QMessageBox.information(self, "Import", f"Imported {result.added} transactions.\n\n" + "\n".join(lines))
+            self.syncLedger()
+
+        self.displayConfirmation(f"Importing {len(paths)} files...")
+        self.tasks.run(self.repo.importFiles, paths, onDone=done, onError=self.error, label="importMany")
 
     #summary button for filling table in and showing summary of monthly expenses/incomes
     def summarizeTable(self):
         month = self.month_edit.text().strip()
         if not month:
             self.error("Enter month as YYYY-MM"); return
-        try:
+
+        def work():
             report = self.rpsvc.monthlySummary(month)
-            ledger = self.repo.load()
-            txs = ledger.listTransactions(month=month)
-            self.fillTable(txs)
+            txs = self.followLedger(self.repo.load()).listTransactions(month=month)
+            return report, txs
+
+        def done(result):
+            report, txs = result
+            self.fillTable(txs, (*monthBounds(month), {}))
+            self.showMonthSummary(LiveMonthSummary(month, report, self.rpsvc.baseAmount))
             QMessageBox.information(
                 self, "Monthly Summary",
                 f"Month: {report.month}\nIncome: {report.income:.2f}\n"
                 f"Expense: {report.expense:.2f}\nNet: {report.net:.2f}"
             )
-        except Exception as e:
-            self.error(str(e))
+
+        self.tasks.run(work, onDone=done, onError=self.error, label="summary")
 
     # def exportExcel(self):
     #     pass
@@ -170,37 +258,113 @@ class FinanceWindow(QWidget):
         month = self.month_edit.text().strip()
         if not month:
             self.error("Enter month as YYYY-MM"); return
-        try:
-            report = self.rpsvc.monthlySummary(month)
+
+        def save(report):
             path, _ = QFileDialog.getSaveFileName(self, "Save Report", f"{month}.xlsx", filter="Excel (*.xlsx)")
             if path:
-                self.repo.exportReport(report, path)
-                self.displayConfirmation(f"Saved report to {path}")
-        except Exception as e:
-            self.error(str(e))
+                self.tasks.run(
+                    self.repo.exportReport, report, path,
+                    onDone=lambda _: self.displayConfirmation(f"Saved report to {path}"),
+                    onError=self.error, label="export",
+                )
 
-    #fill the table in based on transaction type
-    def fillTable(self, txs):
-        self.table.setRowCount(0)
-        for t in txs:
-            ttype = "INCOME" if t.effectiveAmount() > 0 else "EXPENSE"
-            row = self.table.rowCount()
-            self.table.insertRow(row)
-            for col, val in enumerate([
-                t.date.isoformat(), t.account, t.category, t.party, ttype,
-                f"{abs(t.effectiveAmount()):.2f}", t.notes
-            ]):
-                item = QTableWidgetItem(val)
-                if col in (0, 5):
-                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
-                self.table.setItem(row, col, item)
+        self.tasks.run(self.rpsvc.monthlySummary, month, onDone=save, onError=self.error, label="exportSummary")
 
+    #fill the table in based on transaction type, view is the (start, end, search spec) it shows
+    def fillTable(self, txs, view):
+        self.model.setTransactions(txs)
+        self.view = view
+
+    # full reload of the table, balances and month totals, for when the month or search changes
     def refreshTable(self):
         month = self.month_edit.text().strip()
-        if not month: return
-        ledger = self.repo.load()
-        txs = ledger.listTransactions(month=month)
-        self.fillTable(txs)
+        spec = parseQuery(self.filter_edit.text())
+
+        # a half-typed month raises here, off the ui thread, and ends up in failed()
+        def work():
+            start, end = monthBounds(month) if month else (None, None)
+            ledger = self.followLedger(self.repo.load())
+            if spec:
+                txs = ledger.search(**spec, start=start, end=end)
+            else:
+                txs = ledger.listTransactions(month=month) if month else None
+            summary = LiveMonthSummary(month, self.rpsvc.monthlySummary(month), self.rpsvc.baseAmount) if month else None
+            return (start, end), txs, summary, ledger.balances()
+
+        def done(result):
+            self.refreshesPending -= 1
+            (start, end), txs, summary, balances = result
+            if txs is not None:
+                self.fillTable(txs, (start, end, spec))
+            self.showMonthSummary(summary)
+            self.liveBalances = LiveBalances(balances)
+            self.showBalances(balances)
+
+        def failed(msg):
+            self.refreshesPending -= 1
+            self.error(msg)
+
+        self.refreshesPending += 1
+        self.tasks.run(work, onDone=done, onError=failed, label="refresh")
+
+    # subscribes to ledger's changes instead of the one loaded before, returns ledger. works with any
+    # repo: a cached one hands out the same ledger and keeps it current, a plain one a new ledger per load
+    def followLedger(self, ledger):
+        with self.ledgerLock:
+            if ledger is not self.ledger:
+                if self.unfollow is not None:
+                    self.unfollow()
+                self.ledger = ledger
+                self.unfollow = ledger.subscribe(self.changes.push)
+        return ledger
+
+    # changes made to the followed ledger have already arrived as events. a load that hands back another
+    # ledger (another process saved, or the repo doesn't keep one) means the view has to start over
+    def syncLedger(self):
+        def work():
+            previous = self.ledger
+            ledger = self.followLedger(self.repo.load())
+            if ledger is not previous:
+                self.changes.push(LedgerEvent(RELOADED, ledger=ledger))
+
+        self.tasks.run(work, onError=self.error, label="sync")
+
+    # ledger change events, on the ui thread. the table, month totals and balances take just the delta,
+    # a swapped ledger means starting over
+    def applyChanges(self, events):
+        if any(e.kind == RELOADED for e in events):
+            # a refresh that's already queued loads the new ledger anyway
+            if not self.refreshesPending:
+                self.refreshTable()
+            return
+        if self.view is not None:
+            start, end, spec = self.view
+            accepts = lambda t: (start is None or t.date >= start) and (end is None or t.date < end) and matchesQuery(t, **spec)
+            self.model.applyEvents(events, accepts)
+        try:
+            if self.monthSummary is not None and any([self.monthSummary.apply(e) for e in events]):
+                self.showMonthSummary(self.monthSummary)
+        except ValueError as e:
+            # an amount that can't be converted (no rate for its date), the totals can't be trusted anymore
+            self.showMonthSummary(None)
+            self.error(str(e))
+        if any([self.liveBalances.apply(e) for e in events]):
+            self.showBalances(self.liveBalances.balances())
+
+    def showMonthSummary(self, summary):
+        self.monthSummary = summary
+        if summary is None:
+            self.month_summary_label.setText("")
+            return
+        self.month_summary_label.setText(
+            f"{summary.month}:  Income {summary.income:,.2f}   Expense {summary.expense:,.2f}   Net {summary.net:,.2f}"
+        )
+
+    def showBalances(self, balances):
+        if not balances:
+            self.balance_label.setText("")
+            return
+        self.balance_label.setText("Balances:  " + "   ".join(f"{name}: {b:,.2f}" for name, b in sorted(balances.items())))
 
     def displayConfirmation(self, msg: str):
         #self.status_label.setText(msg) #for bottom confirmation line
@@ -211,6 +375,12 @@ class FinanceWindow(QWidget):
     def error(self, msg): 
         QMessageBox.critical(self, "Error", msg)
 
+    # queued adds are written before the window goes away
+    def closeEvent(self, event):
+        self.pendingAdds.flush()
+        self.tasks.waitForDone()
+        super().closeEvent(event)
+
 def runGUI(repo, rpsvc):
     app = QApplication.instance() or QApplication(sys.argv)
     win = FinanceWindow(repo, rpsvc)
@@ -0,0 +1,121 @@
+import threading
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+
+from core.instrumentation import span
+
+# signals live on the ui thread, so emitting them from a worker queues the slot onto the ui thread
+class TaskSignals(QObject):
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    progress = pyqtSignal(int, int)
+
+class Task(QRunnable):
+    def __init__(self, fn, args, kwargs, label=None):
+        super().__init__()
+        self.label = label
+        self.setAutoDelete(False)
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = TaskSignals()
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    # progress callback for long operations (importFile), returns False once the task was cancelled
+    def reportProgress(self, done, added):
+        self.signals.progress.emit(done, added)
+        return not self.cancelled
+
+    def run(self):
+        try:
+            with span(f"gui.{self.label or getattr(self.fn, '__name__', 'task')}"):
+                result = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+            return
+        self.signals.finished.emit(result)
+
+# runs repository/reporting calls off the ui thread. one worker by default so storage
+# operations keep the order they were queued in and never touch the files concurrently
+class TaskRunner:
+    def __init__(self, maxThreads=1):
+        self._pool = QThreadPool()
+        self._pool.setMaxThreadCount(maxThreads)
+        # python side references so tasks aren't collected while queued
+        self._tasks = set()
+
+    # label names the gui.<label> metrics span, defaults to the function name
+    def run(self, fn, *args, onDone=None, onError=None, onProgress=None, label=None, **kwargs):
+        task = Task(fn, args, kwargs, label)
+        if onProgress is not None:
+            task.kwargs["onProgress"] = task.reportProgress
+            task.signals.progress.connect(onProgress)
+        task.signals.finished.connect(lambda result: self._finish(task, onDone, result))
+        task.signals.failed.connect(lambda msg: self._finish(task, onError, msg))
+        self._tasks.add(task)
+        self._pool.start(task)
+        return task
+
+    def _finish(self, task, callback, value):
+        self._tasks.discard(task)
+        if callback is not None:
+            callback(value)
+
+    def waitForDone(self):
+        self._pool.waitForDone()
+
+# gathers items added in quick succession and commits them as one batch once things go quiet
+class SaveCoalescer:
+    def __init__(self, runner, commit, delayMs=300, onCommitted=None, onError=None):
+        self._runner = runner
+        self._commit = commit
+        self._onCommitted = onCommitted
+        self._onError = onError
+        self._pending = []
+        self._timer = QTimer()
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delayMs)
+        self._timer.timeout.connect(self.flush)
+
+    def add(self, item):
+        self._pending.append(item)
+        self._timer.start()
+
+    def flush(self):
+        self._timer.stop()
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        self._runner.run(
+            self._commit, batch,
+            onDone=lambda _: self._onCommitted and self._onCommitted(batch),
+            onError=self._onError, label="commit",
+        )
+
+# ledger change events arrive on whichever thread changed the ledger (usually a task worker).
+# they're queued here and handed to apply(events) on the ui thread, everything that piled up in one go
+class ChangeQueue(QObject):
+    ready = pyqtSignal()
+
+    def __init__(self, apply, parent=None):
+        super().__init__(parent)
+        self._apply = apply
+        self._pending = []
+        self._lock = threading.Lock()
+        self.ready.connect(self._drain)
+
+    def push(self, event):
+        with self._lock:
+            self._pending.append(event)
+            first = len(self._pending) == 1
+        if first:
+            self.ready.emit()
+
+    def _drain(self):
+        with self._lock:
+            events, self._pending = self._pending, []
+        if events:
+            self._apply(events)
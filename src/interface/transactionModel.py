@@ -0,0 +1,134 @@
+from bisect import bisect_left
+
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QVariant
+
+HEADERS = ["Date", "Account", "Category", "Party", "Type", "Amount", "Notes"]
+RIGHT_ALIGNED = (0, 5)
+
+# table model straight over the ledger's transaction list, cells are only formatted when
+# the view asks for them, so only the rows on screen ever cost anything
+class TransactionTableModel(QAbstractTableModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        # rows kept ascending by sort key next to their keys, so a changed row is found and placed
+        # with a bisect. descending order just reads the list back to front
+        self._txs = []
+        self._keys = []
+        self._sortColumn = None
+        self._sortOrder = Qt.AscendingOrder
+
+    # txs come from listRange/search, already in (date, id) order
+    def setTransactions(self, txs):
+        self.beginResetModel()
+        self._txs = txs if isinstance(txs, list) else list(txs)
+        if self._sortColumn is not None:
+            self._sortRows()
+        else:
+            self._keys = [self.sortKey(t) for t in self._txs]
+        self.endResetModel()
+
+    def _descending(self):
+        return self._sortColumn is not None and self._sortOrder == Qt.DescendingOrder
+
+    # list position <-> view row, the same mapping both ways
+    def _position(self, row):
+        return len(self._txs) - 1 - row if self._descending() else row
+
+    def transactionAt(self, row):
+        return self._txs[self._position(row)]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._txs)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return HEADERS[section]
+        return QVariant()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return QVariant()
+        col = index.column()
+        if role == Qt.DisplayRole:
+            return self.display(self._txs[self._position(index.row())], col)
+        if role == Qt.TextAlignmentRole and col in RIGHT_ALIGNED:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        return QVariant()
+
+    @staticmethod
+    def display(t, col):
+        if col == 0:
+            return t.date.isoformat()
+        if col == 1:
+            return t.account
+        if col == 2:
+            return t.category
+        if col == 3:
+            return t.party
+        if col == 4:
+            return t.kind
+        if col == 5:
+            return f"{abs(t.effectiveAmount()):.2f}"
+        return t.notes
+
+    # raw values so dates and amounts sort as dates and numbers, not text
+    @staticmethod
+    def sortValue(t, col):
+        if col == 0:
+            return t.date.toordinal()
+        if col == 5:
+            return abs(t.effectiveAmount())
+        return TransactionTableModel.display(t, col)
+
+    # unique per row: the sorted column's value, then (date, id) like the ledger's own order
+    def sortKey(self, t):
+        key = (t.date.toordinal(), t.id)
+        if self._sortColumn is None:
+            return key
+        return (self.sortValue(t, self._sortColumn),) + key
+
+    # one list.sort over the transactions instead of qt comparing cells through data()
+    def sort(self, column, order=Qt.AscendingOrder):
+        self._sortColumn = column if column >= 0 else None
+        self._sortOrder = order
+        self.layoutAboutToBeChanged.emit()
+        self._sortRows()
+        self.layoutChanged.emit()
+
+    def _sortRows(self):
+        pairs = sorted((self.sortKey(t), t) for t in self._txs) if self._txs else []
+        # keys are unique, so the sort never falls through to comparing transactions
+        self._keys = [k for k, _ in pairs]
+        self._txs = [t for _, t in pairs]
+
+    # applies ledger change events (core.events) in place: the previous version of a row comes out,
+    # the new one goes in where it sorts if accepts(transaction) says it belongs in this view.
+    # costs a bisect and a list insert per event, however many rows are shown
+    def applyEvents(self, events, accepts):
+        for event in events:
+            if event.previous is not None:
+                i = self._find(event.previous)
+                if i is not None:
+                    row = self._position(i)
+                    self.beginRemoveRows(QModelIndex(), row, row)
+                    del self._txs[i], self._keys[i]
+                    self.endRemoveRows()
+            t = event.transaction
+            if t is not None and accepts(t):
+                key = self.sortKey(t)
+                i = bisect_left(self._keys, key)
+                if i < len(self._keys) and self._keys[i] == key:
+                    continue
+                row = len(self._txs) - i if self._descending() else i
+                self.beginInsertRows(QModelIndex(), row, row)
+                self._txs.insert(i, t)
+                self._keys.insert(i, key)
+                self.endInsertRows()
+
+    def _find(self, t):
+        key = self.sortKey(t)
+        i = bisect_left(self._keys, key)
+        return i if i < len(self._keys) and self._keys[i] == key else None
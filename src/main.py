@@ -1,14 +1,39 @@
+import sys
 from pathlib import Path
-from storage.excelRepository import PandasExcelLedgerRepository
+from core import instrumentation
+from core.rates import RateTable
+from storage.journalRepository import JournaledExcelLedgerRepository
+from storage.cachedRepository import CachedLedgerRepository
 from services.reporting import ReportingService
-from interface.gui import runGUI
+
+SNAPSHOT_PATH = Path(__file__).parent / "storage" / "excelTracker.xlsx"
+# 'date,currency,rate' lines, only needed once some accounts or transactions aren't in CAD
+RATES_PATH = Path(__file__).parent / "storage" / "rates.csv"
+
+# pandas and Qt are only imported once a command actually needs them
+def openRepository(path=SNAPSHOT_PATH):
+    return CachedLedgerRepository(JournaledExcelLedgerRepository(_snapshot_path=path))
+
+# exchange rates for reports, None while there's no rates file
+def loadRates(path=RATES_PATH):
+    path = Path(path)
+    return RateTable.fromCsv(path) if path.exists() else None
 
 def main():
-    here = Path(__file__).parent / "storage"
-    repo_path = here / "excelTracker.xlsx"
-    repo = PandasExcelLedgerRepository(_snapshot_path=repo_path)
+    instrumentation.installExitDump()
+    # any arguments run the headless cli instead of the window
+    if len(sys.argv) > 1:
+        from cli import main as cliMain
+        sys.exit(cliMain(sys.argv[1:]))
 
-    rpsvc = ReportingService(repo)
+    repo = openRepository()
+    try:
+        rates = loadRates()
+    except ValueError as e:
+        print(f"[WARN] Exchange rates not loaded: {e}")
+        rates = None
+    rpsvc = ReportingService(repo, rates)
+    from interface.gui import runGUI
     runGUI(repo, rpsvc)
 
 if __name__ == "__main__":
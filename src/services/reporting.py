@@ -1,19 +1,59 @@
-from storage.repository import LedgerRepository, CategorySummary, Report
+from datetime import date
+
+from core.ledger import monthBounds
+from core.account import DEFAULT_CURRENCY
+from core.aggregates import MonthlyAggregates, MonthTotals, CategoryTotals, PERIOD_LABELS, monthKey, monthKeys
+from core.instrumentation import span, timed
+from core.events import ACCOUNT_ADDED
+from storage.repository import LedgerRepository, CategorySummary, Report, RangeReport
+
+# 'YYYY-MM' strings cover the whole month (end month included), dates are used as start <= date < end
+def _rangeBounds(start, end):
+    if not isinstance(start, date):
+        start = monthBounds(start)[0]
+    if not isinstance(end, date):
+        end = monthBounds(end)[1]
+    if end <= start:
+        raise ValueError("range end must come after its start")
+    return start, end
 
 class ReportingService:
-    def __init__(self, repo: LedgerRepository):
+    # rates is a RateTable, only needed once some amounts aren't in DEFAULT_CURRENCY
+    def __init__(self, repo: LedgerRepository, rates=None):
         self._repo = repo
+        self._rates = rates
 
+    @timed("reporting.monthlySummary")
     def monthlySummary(self, month):
+        report = self._repo.summarizeMonth(month)
+        if report is not None:
+            return report
         ledger = self._repo.load()
-        txs = ledger.listTransactions(month=month)
-        income = sum(t.effectiveAmount() for t in txs if t.effectiveAmount() > 0)
-        expense = -sum(t.effectiveAmount() for t in txs if t.effectiveAmount() < 0)
-        net = income - expense
+        if not month:
+            if ledger.currencies() in ([], [DEFAULT_CURRENCY]):
+                return self.summarize(month, ledger.listTransactions(month=month))
+            totals = MonthTotals()
+            for t in self.convertedTotals(ledger, None, None).values():
+                totals.merge(t)
+            return Report.fromTotals(month, totals)
+        totals = ledger.monthlyTotals(month)
+        if totals.foreign:
+            start, end = monthBounds(month)
+            totals = self.convertedTotals(ledger, start, end).get(monthKey(start), MonthTotals())
+        return Report.fromTotals(month, totals)
 
+    # report by walking the given transactions once
+    @staticmethod
+    def summarize(month, txs):
+        income = expense = 0.0
         by = {}
         for t in txs:
-            amt = abs(t.effectiveAmount())
+            e = t.effectiveAmount()
+            if e > 0:
+                income += e
+            elif e < 0:
+                expense -= e
+            amt = abs(e)
             cs = by.get(t.category)
             if cs is None:
                 by[t.category] = CategorySummary(t.category, amt, 1)
@@ -21,7 +61,153 @@ class ReportingService:
                 cs.total += amt
                 cs.count += 1
 
-        return Report(month, income, expense, net, list(by.values()))
+        return Report(month, income, expense, income - expense, list(by.values()))
+
+    # income/expense/net and the category breakdown for every month, quarter or year in the range.
+    # month-aligned ranges are folded from the maintained month aggregates, anything else takes one pass
+    @timed("reporting.rangeSummary")
+    def rangeSummary(self, start, end, granularity="month"):
+        label = PERIOD_LABELS.get(granularity)
+        if label is None:
+            raise ValueError(f"granularity must be one of {sorted(PERIOD_LABELS)}")
+        start, end = _rangeBounds(start, end)
+        keys = monthKeys(start, end)
+
+        months = self._repo.summarizeMonths(start, end)
+        if months is None:
+            ledger = self._repo.load()
+            if start.day == 1 and end.day == 1:
+                months = {key: ledger.monthlyTotals(key) for key in keys}
+            else:
+                window = MonthlyAggregates()
+                for t in ledger.listRange(start, end):
+                    window.add(t)
+                months = window.byMonth()
+            if any(t.foreign for t in months.values()):
+                months = self.convertedTotals(ledger, start, end)
+
+        periods = {}
+        for key in keys:
+            totals = periods.setdefault(label(key), MonthTotals())
+            if key in months:
+                totals.merge(months[key])
+        return RangeReport(start, end, granularity, [Report.fromTotals(p, t) for p, t in periods.items()])
 
     def byCategory(self, month):
         return self.monthlySummary(month).byCategory
+
+    # {'YYYY-MM': MonthTotals} for start <= date < end with every amount converted to DEFAULT_CURRENCY at
+    # the rate of its own date. the window is converted as whole columns: one rate lookup per currency
+    # and a grouped sum, nothing runs once per transaction
+    def convertedTotals(self, ledger, start, end):
+        import numpy as np
+        cols = ledger.rangeColumns(start, end)
+        if not len(cols["days"]):
+            return {}
+        # rangeColumns hands back its own copy of the window (array slices), numpy wraps those without copying again
+        column = lambda name: np.frombuffer(cols[name], dtype=cols[name].typecode)
+        days = column("days")
+        with span("reporting.convert", rows=len(days)):
+            currency = column("currency")
+            converted = column("cents").astype(np.float64)
+            for code in np.unique(currency):
+                label = cols["label"](int(code))
+                if label != DEFAULT_CURRENCY:
+                    rows = currency == code
+                    converted[rows] *= self._requireRates(label).factors(label, days[rows])
+            converted = np.rint(converted)
+            income = column("income") != 0
+
+            # rows are in (date, id) order, so months are consecutive runs and the first row of each
+            # (month, category) group is its 'first'
+            first, last = date.fromordinal(int(days[0])), date.fromordinal(int(days[-1]))
+            keys = monthKeys(first, date.fromordinal(last.toordinal() + 1))
+            starts = np.array([monthBounds(key)[0].toordinal() for key in keys])
+            month = np.searchsorted(starts, days, side="right") - 1
+            categories, category = np.unique(column("category"), return_inverse=True)
+            groups, firstRow, group = np.unique(
+                month * len(categories) + category, return_index=True, return_inverse=True
+            )
+            incomeCents = np.rint(np.bincount(group, converted * income, len(groups)))
+            expenseCents = np.rint(np.bincount(group, converted * ~income, len(groups)))
+            counts = np.bincount(group, minlength=len(groups))
+
+            months = {}
+            for g, row in enumerate(firstRow):
+                key = keys[groups[g] // len(categories)]
+                totals = months.setdefault(key, MonthTotals())
+                totals.categories[cols["label"](int(categories[groups[g] % len(categories)]))] = CategoryTotals(
+                    int(incomeCents[g]), int(expenseCents[g]), int(counts[g]),
+                    (date.fromordinal(int(days[row])), cols["idAt"](int(row))),
+                )
+        return months
+
+    # effectiveAmount() of one transaction in DEFAULT_CURRENCY, rounded the same way convertedTotals does
+    def baseAmount(self, transaction):
+        e = transaction.effectiveAmount()
+        currency = transaction.currency or DEFAULT_CURRENCY
+        if currency == DEFAULT_CURRENCY:
+            return e
+        cents = round(round(abs(e) * 100) * self._requireRates(currency).rate(currency, transaction.date))
+        return cents / 100 if e > 0 else -cents / 100
+
+    def _requireRates(self, currency):
+        if self._rates is None:
+            raise ValueError(f"Amounts in {currency} need exchange rates, none are loaded")
+        return self._rates
+
+# income and expense of one month kept current from ledger change events (see Ledger.subscribe),
+# so a summary that stays on screen never goes back to the ledger
+class LiveMonthSummary:
+    # convert(transaction) gives the amount in the report's currency, effectiveAmount() by default
+    def __init__(self, month, report, convert=None):
+        self.month = month
+        self._convert = convert or (lambda t: t.effectiveAmount())
+        self._start, self._end = monthBounds(month)
+        self._incomeCents = round(report.income * 100)
+        self._expenseCents = round(report.expense * 100)
+
+    # True when the event touched this month
+    def apply(self, event):
+        changed = False
+        for t, sign in ((event.previous, -1), (event.transaction, 1)):
+            if t is None or not (self._start <= t.date < self._end):
+                continue
+            e = self._convert(t)
+            if e > 0:
+                self._incomeCents += sign * round(e * 100)
+            elif e < 0:
+                self._expenseCents += sign * round(-e * 100)
+            changed = True
+        return changed
+
+    @property
+    def income(self):
+        return self._incomeCents / 100
+
+    @property
+    def expense(self):
+        return self._expenseCents / 100
+
+    @property
+    def net(self):
+        return (self._incomeCents - self._expenseCents) / 100
+
+# current balance per account, kept up to date the same way
+class LiveBalances:
+    def __init__(self, balances):
+        self._cents = {name: round(b * 100) for name, b in balances.items()}
+
+    def apply(self, event):
+        if event.kind == ACCOUNT_ADDED:
+            self._cents.setdefault(event.account.name, 0)
+            return True
+        changed = False
+        for t, sign in ((event.previous, -1), (event.transaction, 1)):
+            if t is not None:
+                self._cents[t.account] = self._cents.get(t.account, 0) + sign * round(t.effectiveAmount() * 100)
+                changed = True
+        return changed
+
+    def balances(self):
+        return {name: cents / 100 for name, cents in self._cents.items()}
@@ -0,0 +1,88 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from core.instrumentation import span
+from .repository import ImportResult
+
+# outcome of one file in a bulk import
+class FileImportResult(ImportResult):
+    def __init__(self, path, error=None):
+        super().__init__(path)
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+class BulkImportResult:
+    def __init__(self, files):
+        self.files = files
+
+    @property
+    def added(self):
+        return sum(f.added for f in self.files)
+
+    @property
+    def duplicates(self):
+        return [d for f in self.files for d in f.duplicates]
+
+    @property
+    def failed(self):
+        return [f for f in self.files if not f.ok]
+
+# workers are started fresh rather than forked: imports run from a gui worker thread, and a fork of a
+# multithreaded (Qt) process can leave the child stuck on a lock another thread held at that moment
+WORKER_CONTEXT = "spawn"
+
+# runs in a worker process: reads and checks a whole file, nothing is shared with the parent.
+# module level so spawned workers can import it.
+# a file with any bad row comes back as an error and contributes nothing
+def parseFile(path):
+    from .streamingImport import readChunks
+    from .excelRepository import PandasExcelLedgerRepository
+    try:
+        transactions, rows = [], []
+        for df in readChunks(path):
+            transactions.extend(PandasExcelLedgerRepository.convertFrame(df))
+            rows.extend(int(i) + 2 for i in df.index)
+        return transactions, rows, None
+    except Exception as e:
+        return None, None, str(e)
+
+# parses the files in parallel, then merges them into the repo's ledger in the order given and
+# commits once. the merge is the only step that touches the ledger, so results don't depend on
+# which worker finished first
+def importFiles(repo, paths, workers=None, onProgress=None, duplicates="flag", toleranceDays=0):
+    from .streamingImport import ImportMerger
+    paths = [Path(p) for p in paths]
+    if workers is None:
+        workers = min(len(paths), os.cpu_count() or 1)
+    with span("import.bulk", files=len(paths)) as s:
+        if workers > 1 and len(paths) > 1:
+            context = multiprocessing.get_context(WORKER_CONTEXT)
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                parsed = list(pool.map(parseFile, paths))
+        else:
+            parsed = [parseFile(p) for p in paths]
+
+        ledger = repo.load()
+        merger = ImportMerger(ledger, duplicates, toleranceDays)
+        results, batch = [], []
+        for i, (path, (transactions, rows, error)) in enumerate(zip(paths, parsed), 1):
+            result = FileImportResult(str(path), error=error)
+            if transactions:
+                merger.nextFile()
+                batch.extend(merger.merge(transactions, rows, result))
+            results.append(result)
+            if onProgress is not None:
+                onProgress(i, len(batch))
+
+        if batch:
+            if repo.appendsCheaply:
+                repo.appendTransactions(batch)
+            else:
+                repo.save(ledger)
+        s.add("rowsAdded", len(batch))
+    return BulkImportResult(results)
@@ -0,0 +1,149 @@
+import threading
+
+from core.account import Account
+from core.events import ChangeFeed, LedgerEvent, RELOADED
+from .repository import LedgerRepository
+
+# keeps the parsed ledger in memory and only goes back to the wrapped repo when its storage changed.
+# load() hands out the cached ledger itself, so callers that mutate it are expected to save() it
+class CachedLedgerRepository(LedgerRepository):
+    def __init__(self, inner: LedgerRepository):
+        self._inner = inner
+        self._ledger = None
+        self._stamp = None
+        # bumped on every write that goes through this wrapper
+        self._writes = 0
+        self._lock = threading.RLock()
+        # change events from whichever ledger is cached, see subscribe()
+        self._feed = ChangeFeed()
+        self._unsubscribe = None
+
+    # anything not part of the repository interface (compact, waitForCompaction, ...) goes to the inner repo
+    def __getattr__(self, name):
+        if name == "_inner":
+            raise AttributeError(name)
+        return getattr(self._inner, name)
+
+    @property
+    def inner(self):
+        return self._inner
+
+    @property
+    def appendsCheaply(self):
+        return self._inner.appendsCheaply
+
+    def _isFresh(self):
+        if self._ledger is None:
+            return False
+        stamp = self._inner.version()
+        # repos that can't report a version are always re-read
+        return stamp is not None and stamp == self._stamp
+
+    def load(self):
+        with self._lock:
+            if not self._isFresh():
+                self._stamp = self._inner.version()
+                self._setLedger(self._inner.load())
+            return self._ledger
+
+    def save(self, ledger):
+        with self._lock:
+            self._inner.save(ledger)
+            self._writes += 1
+            self._setLedger(ledger)
+            self._stamp = self._inner.version()
+
+    def appendTransaction(self, transaction):
+        self.appendTransactions([transaction])
+
+    # inner repos that append cheaply get the batch as is, for the rest the inner append would load and
+    # save the whole ledger, so the batch goes into the cached ledger and that is saved instead
+    def appendTransactions(self, transactions):
+        with self._lock:
+            if not self._inner.appendsCheaply:
+                ledger = self.load()
+                self._addToCache(ledger, transactions)
+                self.save(ledger)
+                return
+            fresh = self._isFresh()
+            self._inner.appendTransactions(transactions)
+            self._writes += 1
+            if not fresh:
+                self.invalidate()
+                return
+            self._addToCache(self._ledger, transactions)
+            self._stamp = self._inner.version()
+
+    @staticmethod
+    def _addToCache(ledger, transactions):
+        for account in {t.account for t in transactions}:
+            if not ledger.getAccount(account):
+                ledger.addAccount(Account(account))
+        for transaction in transactions:
+            # streamed imports have already added them to the cached ledger
+            if ledger.getTransaction(transaction.id) is not transaction:
+                ledger.addTransaction(transaction)
+
+    def importTransactions(self, path, ledger):
+        try:
+            return self._inner.importTransactions(path, ledger)
+        except Exception:
+            # a failed import may have left the cached ledger half updated
+            if ledger is self._ledger:
+                self.invalidate()
+            raise
+
+    def importFile(self, path, onProgress=None, duplicates="flag", toleranceDays=0):
+        try:
+            return super().importFile(path, onProgress, duplicates, toleranceDays)
+        except Exception:
+            self.invalidate()
+            raise
+
+    def importFiles(self, paths, workers=None, onProgress=None, duplicates="flag", toleranceDays=0):
+        try:
+            return super().importFiles(paths, workers, onProgress, duplicates, toleranceDays)
+        except Exception:
+            self.invalidate()
+            raise
+
+    def exportReport(self, report, path):
+        return self._inner.exportReport(report, path)
+
+    def version(self):
+        return (self._writes, self._inner.version())
+
+    # a fresh cache answers from memory, otherwise let the inner repo aggregate if it can
+    def summarizeMonth(self, month):
+        with self._lock:
+            if self._isFresh():
+                return None
+        return self._inner.summarizeMonth(month)
+
+    def summarizeMonths(self, start, end):
+        with self._lock:
+            if self._isFresh():
+                return None
+        return self._inner.summarizeMonths(start, end)
+
+    def invalidate(self):
+        with self._lock:
+            self._setLedger(None)
+            self._stamp = None
+
+    # callback(LedgerEvent) for every change to the cached ledger, whoever makes it (appends, imports,
+    # callers mutating load()'s result). when the cache moves to another ledger a RELOADED event
+    # carries it, returns a function that unsubscribes
+    def subscribe(self, callback):
+        return self._feed.subscribe(callback)
+
+    def _setLedger(self, ledger):
+        if ledger is self._ledger:
+            return
+        if self._unsubscribe is not None:
+            self._unsubscribe()
+            self._unsubscribe = None
+        self._ledger = ledger
+        if ledger is not None:
+            self._unsubscribe = ledger.subscribe(self._feed.publish)
+            self._feed.publish(LedgerEvent(RELOADED, ledger=ledger))
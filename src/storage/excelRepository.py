@@ -1,21 +1,63 @@
+import os
+import zipfile
+from contextlib import nullcontext
+from xml.etree import ElementTree
 from pathlib import Path
 from datetime import datetime, date
-import pandas as pd
 
-from core.ledger import Ledger
+from core.ledger import Ledger, monthBounds
+from core.aggregates import MonthlyAggregates, monthKey, monthKeys
+from core.instrumentation import span, count
 from core.account import Account
-from core.transaction import Transaction
-from .repository import LedgerRepository
+from core.transaction import Transaction, Income, Expense, RECORD_COLUMNS
+from .repository import LedgerRepository, Report, RangeReport, RowValidationError, fileStamp, rowState, rebaseLedger
+from .fileLock import FileLock
+from .streamingExport import writeWorkbook
 
 SNAPSHOT_DEFAULT = Path("storage") / "excelTracker.xlsx"
+AGGREGATE_COLUMNS = ["month", "category", "income", "expense", "count", "firstDate", "firstId", "foreign"]
+REQUIRED_COLUMNS = {"id", "date", "account", "category", "type", "amount", "notes", "payor", "payee"}
+# extra part in the snapshot zip with the crc32 of every workbook part as we wrote them. a workbook that was
+# edited (and saved by excel, openpyxl, ...) loses it or no longer matches it, and then the stored
+# MonthlyTotals sheet isn't trusted. plain xml, so it has a content type like every other part
+CHECK_PART = "financeTracker/snapshot.xml"
+
+def _partChecksums(zf):
+    return {i.filename: i.CRC for i in zf.infolist() if i.filename.startswith("xl/")}
+
+# records the checksums of a freshly written workbook, appending to a zip doesn't rewrite the other parts
+def stampWorkbook(path):
+    with zipfile.ZipFile(path, "a") as zf:
+        root = ElementTree.Element("parts")
+        for name, crc in sorted(_partChecksums(zf).items()):
+            ElementTree.SubElement(root, "part", name=name, crc=str(crc))
+        zf.writestr(CHECK_PART, ElementTree.tostring(root, encoding="unicode"))
+
+# True when every part is still the way stampWorkbook saw it, reads only the zip directory and the check
+def workbookUnchanged(path):
+    try:
+        with zipfile.ZipFile(path) as zf:
+            root = ElementTree.fromstring(zf.read(CHECK_PART))
+            stored = {p.get("name"): int(p.get("crc")) for p in root.iter("part")}
+            return stored == _partChecksums(zf)
+    except (KeyError, ValueError, TypeError, OSError, zipfile.BadZipFile, ElementTree.ParseError):
+        return False
 
 class PandasExcelLedgerRepository(LedgerRepository):
-    def __init__(self, _snapshot_path):
+    def __init__(self, _snapshot_path, ledgerType=Ledger):
+        # Ledger, or ColumnarLedger for very large histories
+        self._ledger_type = ledgerType
         if not _snapshot_path:
             self._snapshot_path = Path(SNAPSHOT_DEFAULT)
         else:
             self._snapshot_path = Path(_snapshot_path)
         self._snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+        # writers in every process serialize on this, readers only take it after losing a few races (see load)
+        self._file_lock = FileLock(self._snapshot_path.with_name(self._snapshot_path.name + ".lock"))
+        # version() and {id: rowState} as of this repo's last load/save, a save against a newer
+        # version gets rebased onto it instead of overwriting it
+        self._loaded_version = None
+        self._base = {}
 
     # find party from excel (whether its income or expense, or payor and payee)
     @staticmethod
@@ -63,38 +105,207 @@ class PandasExcelLedgerRepository(LedgerRepository):
             notes=str(row.get("notes", "")),
             payor=payor,
             payee=payee,
+            currency=str(row.get("currency") or "").strip().upper() or None,
         )
 
+    # converts a whole transactions sheet column by column instead of row by row,
+    # every bad row is collected and raised together
+    @staticmethod
+    def convertFrame(df):
+        import pandas as pd
+        df = df.fillna("")
+
+        def column(name, strip=False):
+            if name not in df.columns:
+                return pd.Series("", index=df.index, dtype=object)
+            col = df[name].astype(str)
+            return col.str.strip() if strip else col
+
+        ids = column("id")
+        kinds = column("type", strip=True).str.upper()
+        payors = column("payor", strip=True)
+        payees = column("payee", strip=True)
+        # optional, blank means the account's currency
+        currencies = column("currency", strip=True).str.upper()
+        dates = pd.to_datetime(df["date"] if "date" in df.columns else column("date"), errors="coerce", format="ISO8601")
+        amounts = df["amount"] if "amount" in df.columns else column("amount")
+        if amounts.dtype == object:
+            amounts = amounts.astype(str).str.strip()
+        amounts = pd.to_numeric(amounts, errors="coerce")
+
+        isIncome = kinds == "INCOME"
+        isExpense = kinds == "EXPENSE"
+        checks = [
+            (~(isIncome | isExpense), lambda i: f"Unknown kind: {kinds.iat[i]!r}"),
+            (dates.isna(), lambda i: f"Invalid date: {df['date'].iat[i]!r}" if "date" in df.columns else "Missing 'date'"),
+            (amounts.isna(), lambda i: "Row is missing required 'amount' column (or it's blank)."),
+            (isIncome & (payors == ""), lambda i: "Missing 'payor' for INCOME row"),
+            (isExpense & (payees == ""), lambda i: "Missing 'payee' for EXPENSE row"),
+            ((currencies != "") & ~currencies.str.fullmatch("[A-Z]{3}"), lambda i: f"Invalid currency: {currencies.iat[i]!r}"),
+        ]
+        errors = []
+        for mask, message in checks:
+            for i in mask.to_numpy().nonzero()[0]:
+                # +2 for the header row and 1-based excel rows, chunked reads keep a running index
+                errors.append((int(df.index[i]) + 2, ids.iat[i], message(i)))
+        if errors:
+            errors.sort(key=lambda e: e[0])
+            raise RowValidationError(errors)
+
+        transactions = []
+        for tid, d, account, category, income, amount, notes, payor, payee, currency in zip(
+            ids.tolist(), dates.dt.date.tolist(), column("account").tolist(), column("category").tolist(),
+            isIncome.tolist(), amounts.tolist(), column("notes").tolist(), payors.tolist(), payees.tolist(),
+            currencies.tolist(),
+        ):
+            if income:
+                transactions.append(Income(tid, d, account, category, amount, payor, notes, currency))
+            else:
+                transactions.append(Expense(tid, d, account, category, amount, payee, notes, currency))
+        return transactions
+
     # for reading excel file and reconstructing the ledger (account and transaction)
-    def load(self):
-        ledger = Ledger()
-        if not self._snapshot_path.exists():
+    def newLedger(self):
+        return self._ledger_type()
+
+    # snapshots are only ever replaced whole, but a read can span several files (journals next to the
+    # workbook) that another process moves in between. a read is only kept if version() is the same
+    # before and after it, otherwise it's retried, and the last try holds the file lock so it can't
+    # be raced. a failure on a stable version raises rather than handing out an empty ledger that the
+    # next save would write back
+    def load(self, retries=3):
+        for attempt in range(retries + 1):
+            last = attempt == retries
+            version = self.version()
+            ledger = self.newLedger()
+            try:
+                with span("excel.load") as s, (self.readLock() if last else nullcontext()):
+                    self.readCurrent(ledger)
+                    s.add("rowsRead", len(ledger.allTransactions()))
+            except Exception as e:
+                if not last and self.version() != version:
+                    count("excel.loadRetries")
+                    continue
+                raise ValueError(f"Failed to load {self._snapshot_path.name}: {e}") from e
+            if not last and self.version() != version:
+                count("excel.loadRetries")
+                continue
+            self._remember(ledger, version)
             return ledger
-        try:
-            with pd.ExcelFile(self._snapshot_path) as xls:
-                if "Accounts" in xls.sheet_names:
-                    accountDF = pd.read_excel(xls, "Accounts").fillna("")
-                    for _, r in accountDF.iterrows():
-                        ledger.addAccount(Account(name=str(r["name"]), type=str(r.get("type", "CASH"))))
-                if "Transactions" in xls.sheet_names:
-                    transactionDF = pd.read_excel(xls, "Transactions").fillna("")
-                    for _, r in transactionDF.iterrows():
-                        transaction = self.convertToTransaction(r.to_dict())
+
+    # held around a read that mustn't race a writer. subclasses with locks of their own take those
+    # too, in the order their writers take them
+    def readLock(self):
+        return self._file_lock
+
+    # everything stored right now, read into ledger
+    def readCurrent(self, ledger):
+        if self._snapshot_path.exists():
+            self.readSnapshot(ledger)
+
+    def _remember(self, ledger, version):
+        self._loaded_version = version
+        self._base = {t.id: rowState(t) for t in ledger.allTransactions()}
+
+    # reads the snapshot into the given ledger, raises instead of warning so callers that
+    # rewrite the snapshot never mistake a bad read for an empty ledger
+    def readSnapshot(self, ledger):
+        import pandas as pd
+        with pd.ExcelFile(self._snapshot_path) as xls:
+            if "Accounts" in xls.sheet_names:
+                accountDF = pd.read_excel(xls, "Accounts").fillna("")
+                types = accountDF["type"].astype(str) if "type" in accountDF.columns else ["CASH"] * len(accountDF)
+                currencies = accountDF["currency"].astype(str) if "currency" in accountDF.columns else [None] * len(accountDF)
+                for name, type, currency in zip(accountDF["name"].astype(str), types, currencies):
+                    ledger.addAccount(Account(name=name, type=type, currency=currency))
+            if "Transactions" in xls.sheet_names:
+                with span("excel.parse"):
+                    transactionDF = pd.read_excel(xls, "Transactions")
+                with span("excel.convert", rows=len(transactionDF)):
+                    for transaction in self.convertFrame(transactionDF):
                         if not ledger.getAccount(transaction.account):
                             ledger.addAccount(Account(transaction.account))
                         ledger.addTransaction(transaction)
-        except Exception as e:
-            print(f"[WARN] Failed to load snapshot: {e}")
-        return ledger
 
-    # write the ledger to the excel
+    def version(self):
+        return fileStamp(self._snapshot_path)
+
+    # write the ledger to the excel. if another writer saved since our last load, their changes are
+    # merged into the ledger first (see rebaseLedger), so neither side's transactions get lost
     def save(self, ledger):
-        accounts = [{"name": a.name, "type": a.type} for a in ledger.listAccounts()]
-        transactions = [t.record() for t in ledger.allTransactions()]
-        self._snapshot_path.parent.mkdir(parents=True, exist_ok=True)
-        with pd.ExcelWriter(self._snapshot_path, engine="xlsxwriter") as xw:
-            pd.DataFrame(accounts).to_excel(xw, sheet_name="Accounts", index=False)
-            pd.DataFrame(transactions).to_excel(xw, sheet_name="Transactions", index=False)
+        with self._file_lock:
+            if self.version() != self._loaded_version:
+                theirs = self.newLedger()
+                self.readCurrent(theirs)
+                taken = rebaseLedger(ledger, theirs, self._base)
+                count("excel.rebase")
+                count("excel.rebasedRows", taken)
+            self.writeSnapshot(ledger)
+            self._remember(ledger, self.version())
+
+    # the ledger as a new snapshot: written next to the old one and renamed over it, readers keep
+    # whichever complete version they opened. rows are streamed straight from the ledger
+    def writeSnapshot(self, ledger):
+        with span("excel.save") as s:
+            self._snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self._snapshot_path.with_name(f"{self._snapshot_path.stem}.{os.getpid()}.tmp.xlsx")
+            _, written, _ = writeWorkbook(tmp, [
+                ("Accounts", ("name", "type", "currency"), ((a.name, a.type, a.currency) for a in ledger.listAccounts())),
+                ("Transactions", RECORD_COLUMNS, (t.row() for t in ledger.allTransactions())),
+                ("MonthlyTotals", AGGREGATE_COLUMNS,
+                 (tuple(r[c] for c in AGGREGATE_COLUMNS) for r in ledger.aggregateRecords())),
+            ])
+            stampWorkbook(tmp)
+            os.replace(tmp, self._snapshot_path)
+            s.add("rowsWritten", written)
+            s.add("bytesWritten", self._snapshot_path.stat().st_size)
+
+    # stored MonthlyTotals sheet as {month: rows}, None for snapshots written before the sheet existed
+    # or changed by anything but this repo since (the totals may not match the transactions anymore).
+    # read with openpyxl directly, a quick summary shouldn't pay for importing pandas
+    def readMonthlyTotals(self):
+        if not self._snapshot_path.exists() or not workbookUnchanged(self._snapshot_path):
+            return None
+        from openpyxl import load_workbook
+        wb = load_workbook(self._snapshot_path, read_only=True, data_only=True)
+        try:
+            if "MonthlyTotals" not in wb.sheetnames:
+                return None
+            rows = wb["MonthlyTotals"].iter_rows(values_only=True)
+            header = [str(h) for h in next(rows, ())]
+            months = {}
+            for values in rows:
+                r = {h: "" if v is None else v for h, v in zip(header, values)}
+                months.setdefault(str(r["month"]), []).append(r)
+            return months
+        finally:
+            wb.close()
+
+    # month report from the stored aggregates sheet, without parsing the transactions sheet
+    def summarizeMonth(self, month):
+        if not month:
+            return None
+        months = self.readMonthlyTotals()
+        if months is None:
+            return None
+        key = monthKey(monthBounds(month)[0])
+        totals = MonthlyAggregates.monthFromRecords(months.get(key, []))
+        # amounts in other currencies have to be converted from the transactions
+        if totals.foreign:
+            return None
+        return Report.fromTotals(month, totals)
+
+    # the sheet is per whole month, so only month-aligned windows can be answered from it
+    def summarizeMonths(self, start, end):
+        if start.day != 1 or end.day != 1:
+            return None
+        months = self.readMonthlyTotals()
+        if months is None:
+            return None
+        totals = {key: MonthlyAggregates.monthFromRecords(months[key]) for key in monthKeys(start, end) if key in months}
+        if any(t.foreign for t in totals.values()):
+            return None
+        return totals
 
     # =====================================================================================================
     # importing and exporting transaction files, not properly done
@@ -105,36 +316,26 @@ class PandasExcelLedgerRepository(LedgerRepository):
     #     pass
 
     def importTransactions(self, path, ledger):
-        path = Path(path)
-        df = pd.read_excel(path)
-        cols = set(df.columns)
-        required = {"id", "date", "account", "category", "type", "amount", "notes", "payor", "payee"}
-        missing = list(required - cols)
-        if missing:
-            raise ValueError(f"Missing required columns: {missing}. Expected schema: {sorted(required)}")
-        added = 0
-        for _, r in df.fillna("").iterrows():
-            t = self.convertToTransaction(r.to_dict())
-            if not ledger.getAccount(t.account):
-                ledger.addAccount(Account(t.account))
-            if ledger.getTransaction(t.id):
-                continue
-            ledger.addTransaction(t)
-            added += 1
-        return added
+        return importExcelTransactions(path, ledger)
 
     def exportReport(self, report, path):
-        path = Path(path)
-        path.parent.mkdir(parents=True, exist_ok=True)
-        summary_df = pd.DataFrame([{
-            "month": report.month,
-            "income": report.income,
-            "expense": report.expense,
-            "net": report.net,
-        }])
-        by_cat_df = pd.DataFrame(
-            [{"category": c.category, "total": c.total, "count": c.count} for c in report.byCategory]
-        )
-        with pd.ExcelWriter(path, engine="xlsxwriter") as xw:
-            summary_df.to_excel(xw, sheet_name="Summary", index=False)
-            by_cat_df.to_excel(xw, sheet_name="ByCategory", index=False)
+        exportExcelReport(report, path)
+
+# excel import/export on their own, other repositories keep excel as their exchange format
+def importExcelTransactions(path, ledger):
+    from .streamingImport import streamTransactions
+    return streamTransactions(path, ledger)
+
+def exportExcelReport(report, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if isinstance(report, RangeReport):
+        summary = (("period", "income", "expense", "net"),
+                   ((p.month, p.income, p.expense, p.net) for p in report.periods))
+        byCategory = (("period", "category", "total", "count"),
+                      ((p.month, c.category, c.total, c.count) for p in report.periods for c in p.byCategory))
+    else:
+        summary = (("month", "income", "expense", "net"), [(report.month, report.income, report.expense, report.net)])
+        byCategory = (("category", "total", "count"), ((c.category, c.total, c.count) for c in report.byCategory))
+    with span("export.report"):
+        writeWorkbook(path, [("Summary", *summary), ("ByCategory", *byCategory)])
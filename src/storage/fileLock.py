@@ -0,0 +1,64 @@
+import threading
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    # windows
+    fcntl = None
+    import msvcrt
+
+def _lock(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        return
+    f.seek(0)
+    while True:
+        try:
+            # LK_LOCK gives up after ~10 seconds, keep waiting like flock does
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            continue
+
+def _unlock(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        return
+    f.seek(0)
+    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+# advisory lock on a file next to the storage, shared by every process that uses the same storage.
+# reentrant within the process, so a save that compacts or rebases can take it again
+class FileLock:
+    def __init__(self, path):
+        self._path = Path(path)
+        self._local = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        self._local.acquire()
+        if self._depth == 0:
+            try:
+                self._file = open(self._path, "a+b")
+                _lock(self._file)
+            except BaseException:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                self._local.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0:
+            try:
+                _unlock(self._file)
+            finally:
+                self._file.close()
+                self._file = None
+        self._local.release()
+        return False
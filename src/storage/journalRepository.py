@@ -0,0 +1,150 @@
+import json
+import threading
+from contextlib import contextmanager
+
+from core.ledger import Ledger
+from core.account import Account
+from core.instrumentation import span
+from .excelRepository import PandasExcelLedgerRepository
+from .repository import fileStamp
+
+# journal size (bytes) after which it gets folded back into the workbook
+JOURNAL_COMPACT_BYTES = 4 * 1024 * 1024
+
+class JournaledExcelLedgerRepository(PandasExcelLedgerRepository):
+    appendsCheaply = True
+
+    def __init__(self, _snapshot_path, compactBytes=JOURNAL_COMPACT_BYTES, background=True, ledgerType=Ledger):
+        super().__init__(_snapshot_path, ledgerType)
+        self._journal_path = self._snapshot_path.with_suffix(".journal")
+        # journal that is currently being folded into the workbook
+        self._pending_path = self._snapshot_path.with_suffix(".journal.compacting")
+        self._compact_bytes = compactBytes
+        self._background = background
+        # snapshot lock guards the workbook + pending journal, append lock guards the live journal
+        self._snapshot_lock = threading.RLock()
+        self._append_lock = threading.Lock()
+        self._compactor = None
+
+    # locks are always taken snapshot lock, file lock, append lock, whichever of them a path needs
+    @contextmanager
+    def readLock(self):
+        with self._snapshot_lock, self._file_lock:
+            yield
+
+    # workbook snapshot plus whatever is still sitting in the journals
+    def readCurrent(self, ledger):
+        with self._snapshot_lock:
+            super().readCurrent(ledger)
+            self.replayJournal(self._pending_path, ledger)
+            with self._append_lock:
+                self.replayJournal(self._journal_path, ledger)
+
+    # full rewrite, journal lines other writers appended since our load come in through the rebase
+    def save(self, ledger):
+        with self._snapshot_lock:
+            super().save(ledger)
+
+    # everything in the journals is now part of the snapshot
+    def writeSnapshot(self, ledger):
+        super().writeSnapshot(ledger)
+        self._journal_path.unlink(missing_ok=True)
+        self._pending_path.unlink(missing_ok=True)
+
+    # appends one record to the journal instead of rewriting the workbook
+    def appendTransaction(self, transaction):
+        self.appendTransactions([transaction])
+
+    def appendTransactions(self, transactions):
+        with span("journal.append", rowsWritten=len(transactions)) as s:
+            lines = "".join(json.dumps(t.record(), separators=(",", ":")) + "\n" for t in transactions)
+            # the file lock keeps other processes' saves and compactions from moving the journal mid-append
+            with self._file_lock, self._append_lock:
+                with open(self._journal_path, "a", encoding="utf-8") as f:
+                    f.write(lines)
+                    size = f.tell()
+            s.add("bytesWritten", len(lines))
+        if size >= self._compact_bytes:
+            if self._background:
+                self.compactInBackground()
+            else:
+                self.compact()
+
+    # the stored aggregates only cover the workbook, so they're only usable with nothing journaled
+    def summarizeMonth(self, month):
+        with self._snapshot_lock:
+            if self._pending_path.exists() or self._journal_path.exists():
+                return None
+            return super().summarizeMonth(month)
+
+    def summarizeMonths(self, start, end):
+        with self._snapshot_lock:
+            if self._pending_path.exists() or self._journal_path.exists():
+                return None
+            return super().summarizeMonths(start, end)
+
+    def version(self):
+        return (fileStamp(self._snapshot_path), fileStamp(self._pending_path), fileStamp(self._journal_path))
+
+    # replays journal lines on top of the ledger, a torn last line from a crash is skipped
+    def replayJournal(self, path, ledger):
+        if not path.exists():
+            return 0
+        replayed = 0
+        with span("journal.replay") as s, open(path, encoding="utf-8") as f:
+            for lineNo, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    transaction = self.convertToTransaction(json.loads(line))
+                except Exception as e:
+                    print(f"[WARN] Skipping journal line {lineNo} in {path.name}: {e}")
+                    continue
+                if not ledger.getAccount(transaction.account):
+                    ledger.addAccount(Account(transaction.account))
+                ledger.addTransaction(transaction)
+                replayed += 1
+            s.add("rowsRead", replayed)
+            s.add("bytesRead", f.tell())
+        return replayed
+
+    # folds the journal back into the workbook, appends keep going to a fresh journal meanwhile.
+    # the file lock is only held to move the journal aside and to swap the snapshot in
+    def compact(self):
+        with self._snapshot_lock, span("journal.compact"):
+            with self._file_lock:
+                # a pending journal left over from an interrupted compaction gets folded in first
+                if not self._pending_path.exists():
+                    with self._append_lock:
+                        if not self._journal_path.exists():
+                            return
+                        self._journal_path.replace(self._pending_path)
+                snapshot = fileStamp(self._snapshot_path)
+            ledger = self.newLedger()
+            PandasExcelLedgerRepository.readCurrent(self, ledger)
+            self.replayJournal(self._pending_path, ledger)
+            with self._file_lock:
+                # another process saved in the meantime, its snapshot already holds the pending journal
+                if fileStamp(self._snapshot_path) != snapshot or not self._pending_path.exists():
+                    return
+                # the plain workbook write, the live journal has to stay
+                PandasExcelLedgerRepository.writeSnapshot(self, ledger)
+                self._pending_path.unlink(missing_ok=True)
+
+    def compactInBackground(self):
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self._compactSafely, name="journal-compactor")
+        self._compactor.start()
+
+    def _compactSafely(self):
+        try:
+            self.compact()
+        except Exception as e:
+            print(f"[WARN] Journal compaction failed: {e}")
+
+    # blocks until a running background compaction finishes
+    def waitForCompaction(self):
+        if self._compactor is not None:
+            self._compactor.join()
@@ -0,0 +1,44 @@
+import argparse
+from pathlib import Path
+
+from .journalRepository import JournaledExcelLedgerRepository
+from .sqliteRepository import SqliteLedgerRepository
+from .partitionedRepository import PartitionedLedgerRepository
+from .parquetRepository import ParquetLedgerRepository
+
+TARGETS = {
+    "sqlite": SqliteLedgerRepository,
+    "partitions": PartitionedLedgerRepository,
+    "parquet": ParquetLedgerRepository,
+}
+
+# one-shot conversion of an excelTracker.xlsx tracker into another storage format. the workbook, a pending
+# compaction and the journal are all read, under the file lock so nobody appends or compacts meanwhile
+def migrateExcel(xlsxPath, targetPath, target="sqlite"):
+    source = JournaledExcelLedgerRepository(xlsxPath, background=False)
+    with source.readLock():
+        # load raises on bad rows, a half-read workbook must never become the new storage
+        ledger = source.load()
+    TARGETS[target](targetPath).save(ledger)
+    return len(ledger.allTransactions())
+
+def migrateExcelToSqlite(xlsxPath, dbPath):
+    return migrateExcel(xlsxPath, dbPath, "sqlite")
+
+def migrateExcelToPartitions(xlsxPath, rootPath):
+    return migrateExcel(xlsxPath, rootPath, "partitions")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert an excel ledger (snapshot plus journal) into another storage format.")
+    parser.add_argument("xlsx", type=Path)
+    parser.add_argument("target", type=Path, help="database file, partition directory or parquet file")
+    parser.add_argument("--to", choices=sorted(TARGETS), default="sqlite")
+    parser.add_argument("--partitioned", action="store_const", dest="to", const="partitions", help="same as --to partitions")
+    args = parser.parse_args(argv)
+    if not args.xlsx.exists():
+        parser.error(f"{args.xlsx} does not exist")
+    n = migrateExcel(args.xlsx, args.target, args.to)
+    print(f"Migrated {n} transactions into {args.target}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import os
+from datetime import date
+from pathlib import Path
+
+from core.ledger import Ledger, monthBounds
+from core.aggregates import MonthTotals, CategoryTotals, monthKey
+from core.instrumentation import span
+from core.account import Account, DEFAULT_CURRENCY
+from core.transaction import Income, Expense
+from .repository import LedgerRepository, Report, fileStamp
+
+PARQUET_DEFAULT = Path("storage") / "financeTracker.parquet"
+COLUMNS = ["id", "date", "account", "category", "type", "amount", "notes", "payor", "payee", "currency"]
+# what reports need, the text columns are never read for them
+REPORT_COLUMNS = ["id", "date", "category", "type", "amount", "currency"]
+# rows are written in date order, so small row groups let a month query skip most of the file
+ROW_GROUP_ROWS = 16384
+
+# pyarrow is optional, only this repository needs it
+def _arrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("ParquetLedgerRepository needs pyarrow: pip install pyarrow") from e
+    return pa, pq
+
+def _schema(pa):
+    text = pa.string()
+    labels = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ("id", text),
+        ("date", pa.date32()),
+        ("account", labels),
+        ("category", labels),
+        ("type", labels),
+        ("amount", pa.float64()),
+        ("notes", text),
+        ("payor", text),
+        ("payee", text),
+        ("currency", labels),
+    ])
+
+# ledger snapshot as a parquet file sorted by date, read memory-mapped. reports read only the columns
+# they need from only the row groups whose date statistics overlap the window. accounts live in the
+# file's key/value metadata, excel stays the import/export format
+class ParquetLedgerRepository(LedgerRepository):
+    def __init__(self, _snapshot_path=None, ledgerType=Ledger, rowGroupRows=ROW_GROUP_ROWS):
+        self._snapshot_path = Path(_snapshot_path) if _snapshot_path else Path(PARQUET_DEFAULT)
+        self._snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+        self._ledger_type = ledgerType
+        self._row_group_rows = rowGroupRows
+
+    def newLedger(self):
+        return self._ledger_type()
+
+    def _open(self):
+        _, pq = _arrow()
+        return pq.ParquetFile(self._snapshot_path, memory_map=True)
+
+    def load(self):
+        ledger = self.newLedger()
+        if not self._snapshot_path.exists():
+            return ledger
+        with span("parquet.load") as s:
+            pf = self._open()
+            meta = pf.schema_arrow.metadata or {}
+            for line in meta.get(b"accounts", b"").decode("utf-8").splitlines():
+                name, _, type = line.partition("\t")
+                type, _, currency = type.partition("\t")
+                ledger.addAccount(Account(name=name, type=type or "CASH", currency=currency))
+            cols = self._read(pf, COLUMNS, lambda columns: pf.read(columns=columns))
+            for tid, d, account, category, kind, amount, notes, payor, payee, currency in zip(*(cols[c] for c in COLUMNS)):
+                if kind == "INCOME":
+                    transaction = Income(tid, d, account, category, amount, payor, notes, currency)
+                else:
+                    transaction = Expense(tid, d, account, category, amount, payee, notes, currency)
+                if not ledger.getAccount(account):
+                    ledger.addAccount(Account(account))
+                ledger.addTransaction(transaction)
+            s.add("rowsRead", len(cols["id"]))
+            s.add("bytesRead", self._snapshot_path.stat().st_size)
+        return ledger
+
+    def save(self, ledger):
+        pa, pq = _arrow()
+        with span("parquet.save") as s:
+            # listRange is already in (date, id) order, which is what keeps the row group statistics tight
+            records = [t.record() for t in ledger.listRange(None, None)]
+            cols = {c: [r[c] for r in records] for c in COLUMNS}
+            cols["date"] = [date.fromisoformat(d) for d in cols["date"]]
+            accounts = "\n".join(f"{a.name}\t{a.type}\t{a.currency}" for a in ledger.listAccounts())
+            schema = _schema(pa).with_metadata({"accounts": accounts})
+            table = pa.Table.from_pydict(cols, schema=schema)
+            tmp = self._snapshot_path.with_name(self._snapshot_path.name + ".tmp")
+            pq.write_table(table, tmp, row_group_size=self._row_group_rows, compression="zstd", write_statistics=True)
+            os.replace(tmp, self._snapshot_path)
+            s.add("rowsWritten", len(records))
+            s.add("bytesWritten", self._snapshot_path.stat().st_size)
+
+    # report columns for start <= date < end, only from row groups whose date range overlaps the window
+    def readWindow(self, start, end, columns=REPORT_COLUMNS):
+        if not self._snapshot_path.exists():
+            return {c: [] for c in columns}
+        with span("parquet.readWindow") as s:
+            pf = self._open()
+            dateColumn = pf.schema_arrow.get_field_index("date")
+            groups = []
+            for i in range(pf.metadata.num_row_groups):
+                stats = pf.metadata.row_group(i).column(dateColumn).statistics
+                # groups without statistics can't be ruled out
+                if stats is None or not stats.has_min_max or (stats.max >= start and stats.min < end):
+                    groups.append(i)
+            s.add("rowGroupsRead", len(groups))
+            s.add("rowGroupsSkipped", pf.metadata.num_row_groups - len(groups))
+            if not groups:
+                return {c: [] for c in columns}
+            wanted = list(dict.fromkeys(["date", *columns]))
+            cols = self._read(pf, wanted, lambda present: pf.read_row_groups(groups, columns=present))
+            keep = [i for i, d in enumerate(cols["date"]) if start <= d < end]
+            s.add("rowsRead", len(keep))
+            return {c: [cols[c][i] for i in keep] for c in columns}
+
+    # columns from a read, files written before a column existed get it filled with None
+    @staticmethod
+    def _read(pf, columns, read):
+        names = set(pf.schema_arrow.names)
+        cols = read([c for c in columns if c in names]).to_pydict()
+        rows = len(next(iter(cols.values()), ()))
+        for c in columns:
+            cols.setdefault(c, [None] * rows)
+        return cols
+
+    # None when the window holds amounts in other currencies, those have to be converted from the transactions
+    def _monthTotals(self, start, end):
+        cols = self.readWindow(start, end)
+        if any(c and c != DEFAULT_CURRENCY for c in set(cols["currency"])):
+            return None
+        months = {}
+        # rows come out in (date, id) order, so the first row seen per category is its 'first'
+        for tid, d, category, kind, amount, _ in zip(*(cols[c] for c in REPORT_COLUMNS)):
+            month = months.setdefault(monthKey(d), MonthTotals())
+            ct = month.categories.get(category)
+            if ct is None:
+                ct = month.categories[category] = CategoryTotals(first=(d, tid))
+            cents = round(abs(amount) * 100)
+            if kind == "INCOME":
+                ct.incomeCents += cents
+            else:
+                ct.expenseCents += cents
+            ct.count += 1
+        return months
+
+    def summarizeMonth(self, month):
+        if not month:
+            return None
+        start, end = monthBounds(month)
+        months = self._monthTotals(start, end)
+        if months is None:
+            return None
+        return Report.fromTotals(month, months.get(monthKey(start), MonthTotals()))
+
+    def summarizeMonths(self, start, end):
+        return self._monthTotals(start, end)
+
+    def importTransactions(self, path, ledger):
+        # pandas is only needed when excel files are involved
+        from .excelRepository import importExcelTransactions
+        return importExcelTransactions(path, ledger)
+
+    def exportReport(self, report, path):
+        from .excelRepository import exportExcelReport
+        exportExcelReport(report, path)
+
+    def version(self):
+        return fileStamp(self._snapshot_path)
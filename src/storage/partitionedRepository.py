@@ -0,0 +1,235 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import weakref
+from datetime import date
+from pathlib import Path
+
+from core.ledger import Ledger, monthBounds
+from core.aggregates import MonthlyAggregates, monthKey, monthKeys
+from core.instrumentation import span
+from core.account import Account, DEFAULT_CURRENCY
+from core.transaction import Income, Expense
+from .repository import LedgerRepository, Report, fileStamp, rowState
+
+PARTITIONS_DEFAULT = Path("storage") / "partitions"
+MANIFEST_NAME = "manifest.json"
+COLUMNS = ["id", "date", "account", "category", "type", "amount", "notes", "payor", "payee", "currency"]
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+# writes next to the target and renames over it, a crash never leaves a half-written file behind
+def _writeAtomic(path, data):
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+# one csv file per month plus a manifest with row counts, checksums and month totals.
+# save() only rewrites the months the ledger marked dirty, so its cost follows the size
+# of the touched months and not the whole history
+class PartitionedLedgerRepository(LedgerRepository):
+    appendsCheaply = True
+
+    def __init__(self, _root_path=None, ledgerType=Ledger):
+        self._root = Path(_root_path) if _root_path else Path(PARTITIONS_DEFAULT)
+        self._root.mkdir(parents=True, exist_ok=True)
+        self._manifest_path = self._root / MANIFEST_NAME
+        self._ledger_type = ledgerType
+        # the ledger handed out by the last load/save, its dirty months are relative to what's on disk.
+        # any other ledger passed to save() gets written out in full
+        self._tracked = None
+
+    def newLedger(self):
+        return self._ledger_type()
+
+    def partitionPath(self, month):
+        return self._root / f"{month}.csv"
+
+    def readManifest(self):
+        if not self._manifest_path.exists():
+            return {"accounts": [], "partitions": {}}
+        return json.loads(self._manifest_path.read_text(encoding="utf-8"))
+
+    def _writeManifest(self, manifest):
+        _writeAtomic(self._manifest_path, json.dumps(manifest, indent=1, sort_keys=True).encode("utf-8"))
+
+    def months(self):
+        return sorted(self.readManifest()["partitions"])
+
+    # Reading
+    def load(self):
+        ledger = self.newLedger()
+        manifest = self.readManifest()
+        with span("partitions.load") as s:
+            for a in manifest["accounts"]:
+                ledger.addAccount(Account(name=a["name"], type=a["type"], currency=a.get("currency")))
+            for month in sorted(manifest["partitions"]):
+                s.add("rowsRead", self._readPartition(month, manifest["partitions"][month], ledger))
+        ledger.markClean()
+        self._tracked = weakref.ref(ledger)
+        return ledger
+
+    # a ledger holding only the given months, for callers that never need the rest of the history
+    def loadMonths(self, months):
+        ledger = self.newLedger()
+        manifest = self.readManifest()
+        for a in manifest["accounts"]:
+            ledger.addAccount(Account(name=a["name"], type=a["type"], currency=a.get("currency")))
+        for month in months:
+            entry = manifest["partitions"].get(month)
+            if entry is not None:
+                self._readPartition(month, entry, ledger)
+        ledger.markClean()
+        return ledger
+
+    # one month straight from its partition, without touching any other file
+    def listTransactions(self, month):
+        key = monthKey(monthBounds(month)[0])
+        return self.loadMonths([key]).listTransactions(key)
+
+    def _readPartition(self, month, entry, ledger):
+        path = self.partitionPath(month)
+        if not path.exists():
+            print(f"[WARN] Missing partition {path.name}, {entry['rows']} transactions not loaded")
+            return 0
+        data = path.read_bytes()
+        if _sha256(data) != entry["sha256"]:
+            print(f"[WARN] Checksum mismatch in partition {path.name}, it was changed outside the tracker")
+        rows = 0
+        for r in csv.DictReader(io.StringIO(data.decode("utf-8"), newline="")):
+            try:
+                d = date.fromisoformat(r["date"])
+                amount = float(r["amount"])
+            except (KeyError, ValueError) as e:
+                print(f"[WARN] Skipping row id={r.get('id')} in {path.name}: {e}")
+                continue
+            if r["type"] == "INCOME":
+                transaction = Income(r["id"], d, r["account"], r["category"], amount, r["payor"], r["notes"], r.get("currency"))
+            else:
+                transaction = Expense(r["id"], d, r["account"], r["category"], amount, r["payee"], r["notes"], r.get("currency"))
+            if not ledger.getAccount(transaction.account):
+                ledger.addAccount(Account(transaction.account))
+            ledger.addTransaction(transaction)
+            rows += 1
+        return rows
+
+    # Writing
+    def save(self, ledger):
+        tracked = self._tracked() if self._tracked is not None else None
+        manifest = self.readManifest()
+        partitions = manifest["partitions"]
+        present = set(ledger.months())
+        if tracked is ledger:
+            months = ledger.dirtyMonths()
+            # a dirty month with nothing left in it loses its partition
+            removed = [m for m in months if m not in present and m in partitions]
+        else:
+            months = sorted(present)
+            removed = [m for m in partitions if m not in present]
+        with span("partitions.save", partitionsWritten=len(months)) as s:
+            for month in months:
+                if month in present:
+                    partitions[month] = self._writePartition(month, ledger.listTransactions(month), ledger.monthlyTotals(month))
+                    s.add("rowsWritten", partitions[month]["rows"])
+            for month in removed:
+                partitions.pop(month, None)
+                self.partitionPath(month).unlink(missing_ok=True)
+            manifest["accounts"] = [{"name": a.name, "type": a.type, "currency": a.currency} for a in ledger.listAccounts()]
+            self._writeManifest(manifest)
+        ledger.markClean()
+        self._tracked = weakref.ref(ledger)
+
+    def _writePartition(self, month, transactions, totals):
+        buf = io.StringIO(newline="")
+        writer = csv.DictWriter(buf, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(t.record() for t in transactions)
+        data = buf.getvalue().encode("utf-8")
+        _writeAtomic(self.partitionPath(month), data)
+        return {
+            "rows": len(transactions),
+            "bytes": len(data),
+            "sha256": _sha256(data),
+            "totals": [
+                {k: v for k, v in r.items() if k != "month"}
+                for r in MonthlyAggregates.monthRecords(month, totals)
+            ],
+        }
+
+    def appendTransaction(self, transaction):
+        self.appendTransactions([transaction])
+
+    # rewrites just the months the new transactions fall in
+    def appendTransactions(self, transactions):
+        byMonth = {}
+        for t in transactions:
+            byMonth.setdefault(monthKey(t.date), []).append(t)
+        manifest = self.readManifest()
+        with span("partitions.append", rowsWritten=len(transactions)):
+            for month, batch in byMonth.items():
+                ledger = self.loadMonths([month])
+                for t in batch:
+                    if not ledger.getAccount(t.account):
+                        ledger.addAccount(Account(t.account))
+                    ledger.addTransaction(t)
+                manifest["partitions"][month] = self._writePartition(
+                    month, ledger.listTransactions(month), ledger.monthlyTotals(month)
+                )
+            known = {a["name"] for a in manifest["accounts"]}
+            for account in dict.fromkeys(t.account for t in transactions):
+                if account not in known:
+                    manifest["accounts"].append({"name": account, "type": "CASH", "currency": DEFAULT_CURRENCY})
+            self._writeManifest(manifest)
+        # the ledger from the last load/save gets them too, otherwise its next save() rewrites these
+        # months from what it holds and the appended rows are gone
+        tracked = self._tracked() if self._tracked is not None else None
+        if tracked is not None:
+            for t in transactions:
+                existing = tracked.getTransaction(t.id)
+                # streamed imports have already added them
+                if existing is not None and rowState(existing) == rowState(t):
+                    continue
+                if not tracked.getAccount(t.account):
+                    tracked.addAccount(Account(t.account))
+                tracked.addTransaction(t)
+
+    def importTransactions(self, path, ledger):
+        # pandas is only needed when excel files are involved
+        from .excelRepository import importExcelTransactions
+        return importExcelTransactions(path, ledger)
+
+    def exportReport(self, report, path):
+        from .excelRepository import exportExcelReport
+        exportExcelReport(report, path)
+
+    def version(self):
+        return fileStamp(self._manifest_path)
+
+    # month totals are kept in the manifest, so reports never open a partition
+    def summarizeMonth(self, month):
+        if not month:
+            return None
+        key = monthKey(monthBounds(month)[0])
+        entry = self.readManifest()["partitions"].get(key)
+        rows = entry["totals"] if entry is not None else []
+        totals = MonthlyAggregates.monthFromRecords(rows)
+        # amounts in other currencies have to be converted from the transactions
+        if totals.foreign:
+            return None
+        return Report.fromTotals(month, totals)
+
+    # the totals are per whole month, so only month-aligned windows can be answered from them
+    def summarizeMonths(self, start, end):
+        if start.day != 1 or end.day != 1:
+            return None
+        partitions = self.readManifest()["partitions"]
+        totals = {
+            key: MonthlyAggregates.monthFromRecords(partitions[key]["totals"])
+            for key in monthKeys(start, end) if key in partitions
+        }
+        if any(t.foreign for t in totals.values()):
+            return None
+        return totals
@@ -1,7 +1,12 @@
+import os
 from abc import ABC, abstractmethod
 from core.ledger import Ledger
+from core.account import Account
 
 class LedgerRepository(ABC):
+    # True when appendTransactions() is cheap enough to call once per import batch
+    appendsCheaply = False
+
     @abstractmethod
     def load(self): ...
     @abstractmethod
@@ -11,6 +16,126 @@ class LedgerRepository(ABC):
     @abstractmethod
     def exportReport(self, report: "Report", path: str): ...
 
+    # adds a single transaction to storage, repos that can append without a full rewrite override this
+    def appendTransaction(self, transaction):
+        ledger = self.load()
+        if not ledger.getAccount(transaction.account):
+            ledger.addAccount(Account(transaction.account))
+        ledger.addTransaction(transaction)
+        self.save(ledger)
+
+    # one load and one save for the whole batch
+    def appendTransactions(self, transactions):
+        ledger = self.load()
+        for account in {t.account for t in transactions}:
+            if not ledger.getAccount(account):
+                ledger.addAccount(Account(account))
+        for transaction in transactions:
+            ledger.addTransaction(transaction)
+        self.save(ledger)
+
+    # streams an .xlsx/.csv file into storage chunk by chunk, onProgress(rowsRead, added) may return
+    # False to stop early. repos that append cheaply commit every chunk, the rest save once at the end
+    # duplicates is "flag" (import and report), "skip" or None (ids only), see streamTransactions
+    def importFile(self, path, onProgress=None, duplicates="flag", toleranceDays=0):
+        from .streamingImport import streamTransactions
+        ledger = self.load()
+        if self.appendsCheaply:
+            return streamTransactions(path, ledger, onBatch=self.appendTransactions, onProgress=onProgress,
+                                      duplicates=duplicates, toleranceDays=toleranceDays)
+        result = streamTransactions(path, ledger, onProgress=onProgress, duplicates=duplicates, toleranceDays=toleranceDays)
+        if result.added:
+            self.save(ledger)
+        return result
+
+    # several files parsed in parallel worker processes, merged in the given order and committed once
+    def importFiles(self, paths, workers=None, onProgress=None, duplicates="flag", toleranceDays=0):
+        from .bulkImport import importFiles
+        return importFiles(self, paths, workers, onProgress, duplicates, toleranceDays)
+
+    # transactions with start <= date < end to an .xlsx or .csv file, streamed in (date, id) order.
+    # returns how many were written
+    def exportTransactions(self, path, start=None, end=None):
+        from .streamingExport import exportTransactions
+        return exportTransactions(self.load().iterRange(start, end), path)
+
+    # token that changes whenever the stored data changes, None when the repo can't tell
+    def version(self):
+        return None
+
+    # repos that can aggregate in storage return a Report here, None means build it from load()
+    def summarizeMonth(self, month):
+        return None
+
+    # same idea for start <= date < end: {'YYYY-MM': MonthTotals} or None to fall back to load()
+    def summarizeMonths(self, start, end):
+        return None
+
+# (mtime, size, inode) of a storage file, None if it doesn't exist. files replaced by rename
+# get a new inode, so a rewrite shows up even when size and mtime happen to match
+def fileStamp(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+# a transaction's content apart from its id, to tell which side of a conflicting save changed it
+def rowState(transaction):
+    t = transaction
+    return hash((t.date, t.account, t.category, t.effectiveAmount(), t.notes, t.party, t.currency))
+
+# folds what another writer stored into ours before a save. base is {id: rowState} as of our last
+# load/save: their new transactions are added, ones only they changed take their version, anything
+# we changed or removed keeps ours. returns how many transactions came from their side
+def rebaseLedger(ours, theirs, base):
+    for account in theirs.listAccounts():
+        ours.addAccount(account)
+    taken = 0
+    for t in list(theirs.allTransactions()):
+        mine = ours.getTransaction(t.id)
+        if mine is None and t.id in base:
+            continue
+        if mine is not None:
+            state = rowState(t)
+            before = base.get(t.id)
+            if before is None or rowState(mine) != before or state == before:
+                continue
+        ours.addTransaction(t)
+        taken += 1
+    return taken
+
+# raised when rows fail validation, carries every bad row instead of stopping at the first one
+class RowValidationError(ValueError):
+    def __init__(self, errors):
+        # list of (row number, id, message)
+        self.errors = errors
+        shown = "\n".join(f"row {row} (id={rid}): {msg}" for row, rid, msg in errors[:20])
+        more = f"\n... and {len(errors) - 20} more" if len(errors) > 20 else ""
+        super().__init__(f"{len(errors)} invalid row(s):\n{shown}{more}")
+
+# an imported row that looks like a transaction already stored under another id
+class DuplicateMatch:
+    def __init__(self, row, id, existingId, skipped):
+        # 1-based row in the imported file, header included
+        self.row = row
+        self.id = id
+        self.existingId = existingId
+        self.skipped = skipped
+
+# what an import did: rows read, rows added, ids that were already known, probable duplicates
+class ImportResult:
+    def __init__(self, path, rowsRead=0, added=0, knownIds=0, duplicates=None):
+        self.path = path
+        self.rowsRead = rowsRead
+        self.added = added
+        self.knownIds = knownIds
+        self.duplicates = duplicates if duplicates is not None else []
+
+    @property
+    def skipped(self):
+        return sum(1 for d in self.duplicates if d.skipped)
+
 class CategorySummary:
     def __init__(self, category: str, total: float, count: int):
         self.category = category
@@ -24,3 +149,29 @@ class Report:
         self.expense = expense
         self.net = net
         self.byCategory = byCategory
+
+    # report from a ledger's maintained month aggregates (core.aggregates.MonthTotals)
+    @classmethod
+    def fromTotals(cls, month, totals):
+        by = [CategorySummary(c, ct.total, ct.count) for c, ct in totals.orderedCategories()]
+        return cls(month, totals.income, totals.expense, totals.net, by)
+
+# one Report per period (month, quarter or year) between start and end
+class RangeReport:
+    def __init__(self, start, end, granularity, periods):
+        self.start = start
+        self.end = end
+        self.granularity = granularity
+        self.periods = periods
+
+    @property
+    def income(self):
+        return sum(p.income for p in self.periods)
+
+    @property
+    def expense(self):
+        return sum(p.expense for p in self.periods)
+
+    @property
+    def net(self):
+        return self.income - self.expense
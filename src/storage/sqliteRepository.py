@@ -0,0 +1,232 @@
+import sqlite3
+from contextlib import closing
+from datetime import date
+from pathlib import Path
+
+from core.ledger import Ledger, monthBounds
+from core.aggregates import MonthTotals, CategoryTotals
+from core.instrumentation import span
+from core.account import Account, DEFAULT_CURRENCY
+from core.transaction import Income, Expense
+from .repository import LedgerRepository, CategorySummary, Report, fileStamp
+
+SQLITE_DEFAULT = Path("storage") / "financeTracker.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    name TEXT PRIMARY KEY,
+    type TEXT NOT NULL DEFAULT 'CASH',
+    currency TEXT NOT NULL DEFAULT 'CAD'
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    id TEXT PRIMARY KEY,
+    date TEXT NOT NULL,
+    account TEXT NOT NULL,
+    category TEXT NOT NULL DEFAULT '',
+    type TEXT NOT NULL,
+    amount REAL NOT NULL,
+    notes TEXT NOT NULL DEFAULT '',
+    payor TEXT NOT NULL DEFAULT '',
+    payee TEXT NOT NULL DEFAULT '',
+    currency TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions(date);
+CREATE INDEX IF NOT EXISTS idx_transactions_account ON transactions(account, date);
+CREATE INDEX IF NOT EXISTS idx_transactions_category ON transactions(category, date);
+"""
+
+COLUMNS = ("id", "date", "account", "category", "type", "amount", "notes", "payor", "payee", "currency")
+# columns added after the first release, databases created before them get them on open
+ADDED_COLUMNS = (
+    ("accounts", "currency", "TEXT NOT NULL DEFAULT 'CAD'"),
+    ("transactions", "currency", "TEXT NOT NULL DEFAULT ''"),
+)
+# rows whose currency isn't the default, a blank one is the account's
+FOREIGN_ROWS = (
+    "SELECT EXISTS(SELECT 1 FROM transactions t WHERE t.date >= ? AND t.date < ?"
+    " AND COALESCE(NULLIF(t.currency, ''), (SELECT a.currency FROM accounts a WHERE a.name = t.account), ?) != ?)"
+)
+UPSERT = f"INSERT OR REPLACE INTO transactions ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+
+def _row(transaction):
+    r = transaction.record()
+    return tuple(r[c] for c in COLUMNS)
+
+# hash of a row as the ledger holds it, the ledger fills a blank currency in from the account
+# (accountCurrency(name), None for an unknown one) so comparing stored rows with ledger rows needs the same
+def _rowHash(row, accountCurrency):
+    if not row[-1]:
+        row = row[:-1] + (accountCurrency(row[2]) or DEFAULT_CURRENCY,)
+    return hash(row)
+
+def _ledgerCurrency(ledger):
+    def currency(name):
+        account = ledger.getAccount(name)
+        return account.currency if account else None
+    return currency
+
+# ledger stored in a sqlite file, excel stays the import/export format
+class SqliteLedgerRepository(LedgerRepository):
+    appendsCheaply = True
+
+    def __init__(self, _db_path=None, ledgerType=Ledger):
+        self._db_path = Path(_db_path) if _db_path else Path(SQLITE_DEFAULT)
+        self._db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._ledger_type = ledgerType
+        # id -> hash of the row as last loaded/saved, so save() only writes what changed.
+        # None until this repo has seen the whole table, then save() rewrites everything
+        self._known = None
+        with closing(self._connect()) as conn, conn:
+            conn.executescript(SCHEMA)
+            for table, column, definition in ADDED_COLUMNS:
+                if column not in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def _connect(self):
+        return sqlite3.connect(self._db_path)
+
+    def load(self):
+        ledger = self._ledger_type()
+        known = {}
+        accountCurrency = _ledgerCurrency(ledger)
+        with span("sqlite.load") as s, closing(self._connect()) as conn:
+            for name, type, currency in conn.execute("SELECT name, type, currency FROM accounts"):
+                ledger.addAccount(Account(name=name, type=type, currency=currency))
+            rows = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM transactions ORDER BY date, id")
+            for row in rows:
+                tid, d, account, category, kind, amount, notes, payor, payee, currency = row
+                if kind == "INCOME":
+                    transaction = Income(tid, date.fromisoformat(d), account, category, amount, payor, notes, currency)
+                else:
+                    transaction = Expense(tid, date.fromisoformat(d), account, category, amount, payee, notes, currency)
+                if not ledger.getAccount(account):
+                    ledger.addAccount(Account(account))
+                ledger.addTransaction(transaction)
+                known[tid] = _rowHash(row, accountCurrency)
+            s.add("rowsRead", len(known))
+        self._known = known
+        return ledger
+
+    # writes only rows that were added or changed since the last load/save, in one transaction
+    def save(self, ledger):
+        previous = self._known
+        known = {}
+        changed = []
+        accountCurrency = _ledgerCurrency(ledger)
+        for t in ledger.allTransactions():
+            row = _row(t)
+            h = _rowHash(row, accountCurrency)
+            known[row[0]] = h
+            if previous is None or previous.get(row[0]) != h:
+                changed.append(row)
+        with span("sqlite.save", rowsWritten=len(changed)), closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO accounts (name, type, currency) VALUES (?, ?, ?)",
+                [(a.name, a.type, a.currency) for a in ledger.listAccounts()],
+            )
+            if previous is None:
+                conn.execute("DELETE FROM transactions")
+            else:
+                removed = [(tid,) for tid in previous if tid not in known]
+                conn.executemany("DELETE FROM transactions WHERE id = ?", removed)
+            conn.executemany(UPSERT, changed)
+        self._known = known
+
+    def appendTransaction(self, transaction):
+        self.appendTransactions([transaction])
+
+    def appendTransactions(self, transactions):
+        rows = [_row(t) for t in transactions]
+        with span("sqlite.append", rowsWritten=len(rows)), closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO accounts (name, type) VALUES (?, 'CASH')",
+                [(a,) for a in {t.account for t in transactions}],
+            )
+            conn.executemany(UPSERT, rows)
+            currencies = dict(conn.execute("SELECT name, currency FROM accounts"))
+        if self._known is not None:
+            for row in rows:
+                self._known[row[0]] = _rowHash(row, currencies.get)
+
+    def importTransactions(self, path, ledger):
+        # pandas is only needed when excel files are involved
+        from .excelRepository import importExcelTransactions
+        return importExcelTransactions(path, ledger)
+
+    def exportReport(self, report, path):
+        from .excelRepository import exportExcelReport
+        exportExcelReport(report, path)
+
+    # rows go from the cursor to the file as they come, the ledger is never loaded
+    def exportTransactions(self, path, start=None, end=None):
+        from .streamingExport import exportRows
+        where, params = [], []
+        if start is not None:
+            where.append("date >= ?")
+            params.append(start.isoformat())
+        if end is not None:
+            where.append("date < ?")
+            params.append(end.isoformat())
+        query = f"SELECT {', '.join(COLUMNS)} FROM transactions"
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        with closing(self._connect()) as conn:
+            # COLUMNS is the RECORD_COLUMNS order, the rows can be written as they are
+            return exportRows(conn.execute(query + " ORDER BY date, id", params), path)
+
+    def version(self):
+        return fileStamp(self._db_path)
+
+    # month totals and the category breakdown straight from the indexes, without loading the ledger
+    def summarizeMonth(self, month):
+        # no month is the all-time report, the service builds that from load() like for every other repo
+        if not month:
+            return None
+        start, end = monthBounds(month)
+        window = (start.isoformat(), end.isoformat())
+        with span("sqlite.summarizeMonth"), closing(self._connect()) as conn:
+            # amounts in other currencies have to be converted from the transactions
+            if self._hasForeign(conn, *window):
+                return None
+            income, expense = conn.execute(
+                "SELECT COALESCE(SUM(CASE WHEN type = 'INCOME' THEN amount END), 0),"
+                " COALESCE(SUM(CASE WHEN type = 'EXPENSE' THEN amount END), 0)"
+                " FROM transactions WHERE date >= ? AND date < ?",
+                window,
+            ).fetchone()
+            # categories come out in order of first appearance, same as the in-memory report
+            byCategory = [
+                CategorySummary(category, total, count)
+                for category, total, count in conn.execute(
+                    "SELECT category, SUM(amount), COUNT(*) FROM transactions"
+                    " WHERE date >= ? AND date < ? GROUP BY category ORDER BY MIN(date || ' ' || id)",
+                    window,
+                )
+            ]
+        return Report(month, income, expense, income - expense, byCategory)
+
+    # one GROUP BY over the window, partial months at either end only hold the rows inside it
+    def summarizeMonths(self, start, end):
+        months = {}
+        with span("sqlite.summarizeMonths"), closing(self._connect()) as conn:
+            if self._hasForeign(conn, start.isoformat(), end.isoformat()):
+                return None
+            rows = conn.execute(
+                "SELECT substr(date, 1, 7), category,"
+                " COALESCE(SUM(CASE WHEN type = 'INCOME' THEN amount END), 0),"
+                " COALESCE(SUM(CASE WHEN type = 'EXPENSE' THEN amount END), 0),"
+                " COUNT(*), MIN(date || ' ' || id)"
+                " FROM transactions WHERE date >= ? AND date < ? GROUP BY 1, 2",
+                (start.isoformat(), end.isoformat()),
+            )
+            for month, category, income, expense, count, first in rows:
+                d, tid = first.split(" ", 1)
+                totals = months.setdefault(month, MonthTotals())
+                totals.categories[category] = CategoryTotals(
+                    round(income * 100), round(expense * 100), count, (date.fromisoformat(d), tid)
+                )
+        return months
+
+    @staticmethod
+    def _hasForeign(conn, start, end):
+        return conn.execute(FOREIGN_ROWS, (start, end, DEFAULT_CURRENCY, DEFAULT_CURRENCY)).fetchone()[0] == 1
@@ -0,0 +1,58 @@
+import csv
+from pathlib import Path
+
+from core.instrumentation import span
+from core.transaction import RECORD_COLUMNS
+
+# cell values are written as they are: a note starting with '=' or holding a url stays plain text
+WORKBOOK_OPTIONS = {
+    "constant_memory": True,
+    "strings_to_formulas": False,
+    "strings_to_urls": False,
+    "strings_to_numbers": False,
+}
+
+# sheets as (name, header, rows) with rows any iterable of tuples. constant_memory mode flushes
+# every row to disk once the next one starts, so memory stays flat however many rows there are.
+# returns the number of rows written per sheet
+def writeWorkbook(path, sheets):
+    import xlsxwriter
+    counts = []
+    wb = xlsxwriter.Workbook(str(path), WORKBOOK_OPTIONS)
+    try:
+        for name, header, rows in sheets:
+            ws = wb.add_worksheet(name)
+            ws.write_row(0, 0, header)
+            written = 0
+            for written, row in enumerate(rows, 1):
+                ws.write_row(written, 0, row)
+            counts.append(written)
+    finally:
+        wb.close()
+    return counts
+
+def writeCsv(path, header, rows):
+    written = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(header)
+        for written, row in enumerate(rows, 1):
+            w.writerow(row)
+    return written
+
+# rows in RECORD_COLUMNS order to .csv or .xlsx depending on the suffix
+def exportRows(rows, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with span("export.transactions") as s:
+        if path.suffix.lower() == ".csv":
+            written = writeCsv(path, RECORD_COLUMNS, rows)
+        else:
+            written = writeWorkbook(path, [("Transactions", RECORD_COLUMNS, rows)])[0]
+        s.add("rowsWritten", written)
+        s.add("bytesWritten", path.stat().st_size)
+    return written
+
+# transactions from any iterable, e.g. Ledger.iterRange
+def exportTransactions(transactions, path):
+    return exportRows((t.row() for t in transactions), path)
@@ -0,0 +1,128 @@
+from pathlib import Path
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from core.account import Account
+from core.instrumentation import span
+from .excelRepository import PandasExcelLedgerRepository, REQUIRED_COLUMNS
+from .repository import ImportResult, DuplicateMatch
+
+# rows parsed and converted at a time, memory stays at about one chunk whatever the file size
+CHUNK_ROWS = 5000
+
+def _checkSchema(columns):
+    missing = list(REQUIRED_COLUMNS - set(columns))
+    if missing:
+        raise ValueError(f"Missing required columns: {missing}. Expected schema: {sorted(REQUIRED_COLUMNS)}")
+
+def _xlsxChunks(path, chunkRows):
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        # same sheet importExcelTransactions reads, workbooks saved by this repo have others next to it
+        sheet = wb["Transactions"] if "Transactions" in wb.sheetnames else wb.worksheets[0]
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            raise ValueError(f"{path.name} is empty")
+        header = [str(h) if h is not None else "" for h in header]
+        _checkSchema(header)
+        buffer, start = [], 0
+        for row in rows:
+            if all(v is None for v in row):
+                continue
+            buffer.append(row)
+            if len(buffer) == chunkRows:
+                yield pd.DataFrame(buffer, columns=header, index=range(start, start + len(buffer)))
+                start += len(buffer)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=header, index=range(start, start + len(buffer)))
+    finally:
+        wb.close()
+
+def _csvChunks(path, chunkRows):
+    checked = False
+    for df in pd.read_csv(path, chunksize=chunkRows, dtype=str, keep_default_na=False):
+        if not checked:
+            _checkSchema(df.columns)
+            checked = True
+        yield df
+    if not checked:
+        _checkSchema(pd.read_csv(path, nrows=0).columns)
+
+# DataFrames of at most chunkRows rows, the required columns are checked once up front
+def readChunks(path, chunkRows=CHUNK_ROWS):
+    path = Path(path)
+    if path.suffix.lower() == ".csv":
+        return _csvChunks(path, chunkRows)
+    return _xlsxChunks(path, chunkRows)
+
+DUPLICATE_MODES = ("flag", "skip", None)
+
+# folds converted rows into a ledger: rows with a known id are left out, rows that look like a stored
+# transaction under another id (core.fingerprints) are reported and, in "skip" mode, left out too.
+# rows added by the same file never count as duplicates of each other, two identical coffees on one
+# statement are two coffees
+class ImportMerger:
+    def __init__(self, ledger, duplicates="flag", toleranceDays=0):
+        if duplicates not in DUPLICATE_MODES:
+            raise ValueError(f"duplicates must be one of {DUPLICATE_MODES}")
+        self.ledger = ledger
+        self.duplicates = duplicates
+        self.toleranceDays = toleranceDays
+        self._index = ledger.fingerprints() if duplicates else None
+        self._claimed = set()
+
+    # starts a new file, earlier files' rows become fair game for matching
+    def nextFile(self):
+        self._claimed = set()
+
+    # new transactions added to the ledger, rows are the file row numbers of the transactions
+    def merge(self, transactions, rows, result):
+        ledger = self.ledger
+        batch = []
+        for t, row in zip(transactions, rows):
+            result.rowsRead += 1
+            if ledger.getTransaction(t.id):
+                result.knownIds += 1
+                continue
+            if self._index is not None:
+                existing = self._index.match(t, self.toleranceDays, self._claimed)
+                if existing is not None:
+                    # each stored row absorbs at most one incoming row
+                    self._claimed.add(existing)
+                    skip = self.duplicates == "skip"
+                    result.duplicates.append(DuplicateMatch(row, t.id, existing, skip))
+                    if skip:
+                        continue
+            if not ledger.getAccount(t.account):
+                ledger.addAccount(Account(t.account))
+            ledger.addTransaction(t)
+            self._claimed.add(t.id)
+            batch.append(t)
+        result.added += len(batch)
+        return batch
+
+# adds every new transaction in the file to the ledger, skipping ids the ledger already has and
+# flagging or skipping probable duplicates. onBatch(transactions) gets each chunk's new rows so
+# callers can commit as they go. returns an ImportResult
+def streamTransactions(path, ledger, onBatch=None, onProgress=None, chunkRows=CHUNK_ROWS,
+                       duplicates="flag", toleranceDays=0):
+    merger = ImportMerger(ledger, duplicates, toleranceDays)
+    result = ImportResult(str(path))
+    with span("import.stream", bytesRead=Path(path).stat().st_size) as total:
+        for df in readChunks(path, chunkRows):
+            with span("import.chunk", rowsRead=len(df)) as s:
+                # +2 for the header row and 1-based rows, same numbering as RowValidationError
+                rows = [int(i) + 2 for i in df.index]
+                batch = merger.merge(PandasExcelLedgerRepository.convertFrame(df), rows, result)
+                s.add("rowsAdded", len(batch))
+            if batch and onBatch is not None:
+                onBatch(batch)
+            if onProgress is not None and onProgress(result.rowsRead, result.added) is False:
+                break
+        total.add("rowsRead", result.rowsRead)
+        total.add("rowsAdded", result.added)
+        total.add("duplicates", len(result.duplicates))
+    return result
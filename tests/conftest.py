@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the app runs from src with its packages (core, storage, ...) at the top level
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
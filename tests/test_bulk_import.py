@@ -0,0 +1,26 @@
+from datetime import date
+
+from core.transaction import Expense
+from storage.bulkImport import importFiles
+from storage.sqliteRepository import SqliteLedgerRepository
+from storage.streamingExport import exportTransactions
+
+# files parsed by (spawned) worker processes end up in storage in the order given
+def test_parallel_import_of_several_files(tmp_path):
+    paths = []
+    for n in range(3):
+        path = tmp_path / f"statement{n}.csv"
+        exportTransactions(
+            [Expense(f"f{n}-{i}", date(2025, 1, 1 + i), "cash", "food", 10 + n, f"shop{n}", "") for i in range(5)],
+            path,
+        )
+        paths.append(path)
+    bad = tmp_path / "bad.csv"
+    bad.write_text("id,date,account,category,type,amount,notes,payor,payee\nx,not a date,cash,,EXPENSE,1,,,shop\n")
+    repo = SqliteLedgerRepository(tmp_path / "t.db")
+
+    result = importFiles(repo, paths + [bad], workers=2)
+
+    assert result.added == 15
+    assert [f.ok for f in result.files] == [True, True, True, False]
+    assert {t.id for t in repo.load().allTransactions()} == {f"f{n}-{i}" for n in range(3) for i in range(5)}
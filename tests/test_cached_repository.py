@@ -0,0 +1,31 @@
+from datetime import date
+
+from core import instrumentation
+from core.account import Account
+from core.ledger import Ledger
+from core.transaction import Expense
+from storage.cachedRepository import CachedLedgerRepository
+from storage.excelRepository import PandasExcelLedgerRepository
+
+# a plain workbook can't append, the cached ledger takes the batch and is saved without reading the file again
+def test_appends_to_a_plain_workbook_reuse_the_cached_ledger(tmp_path):
+    path = tmp_path / "t.xlsx"
+    ledger = Ledger()
+    ledger.addAccount(Account("cash"))
+    PandasExcelLedgerRepository(path).save(ledger)
+    repo = CachedLedgerRepository(PandasExcelLedgerRepository(path))
+    cached = repo.load()
+
+    instrumentation.registry.reset()
+    instrumentation.enable()
+    try:
+        for i in range(3):
+            repo.appendTransactions([Expense(str(i), date(2025, 1, i + 1), "cash", "food", 5, "shop", "")])
+    finally:
+        instrumentation.disable()
+    spans = instrumentation.registry.snapshot()["spans"]
+    assert "excel.load" not in spans
+    assert spans["excel.save"]["calls"] == 3
+
+    assert repo.load() is cached and len(cached.allTransactions()) == 3
+    assert sorted(t.id for t in PandasExcelLedgerRepository(path).load().allTransactions()) == ["0", "1", "2"]
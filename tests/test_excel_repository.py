@@ -0,0 +1,41 @@
+from datetime import date
+
+import openpyxl
+
+from core.account import Account
+from core.ledger import Ledger
+from core.transaction import Income, Expense
+from services.reporting import ReportingService
+from storage.excelRepository import PandasExcelLedgerRepository
+
+def sampleLedger():
+    ledger = Ledger()
+    ledger.addAccount(Account("cash"))
+    ledger.addTransaction(Income("a", date(2025, 1, 3), "cash", "pay", 1000, "boss", ""))
+    ledger.addTransaction(Expense("b", date(2025, 1, 4), "cash", "food", 40, "shop", ""))
+    return ledger
+
+def test_month_summary_comes_from_the_stored_totals(tmp_path):
+    repo = PandasExcelLedgerRepository(tmp_path / "t.xlsx")
+    repo.save(sampleLedger())
+    report = repo.summarizeMonth("2025-01")
+    assert (report.income, report.expense) == (1000, 40)
+    assert repo.load().getTransaction("b").amount == 40
+
+# a workbook edited by hand has to be summarized from its transactions, not the stale totals sheet
+def test_edited_workbook_is_not_summarized_from_stale_totals(tmp_path):
+    path = tmp_path / "t.xlsx"
+    repo = PandasExcelLedgerRepository(path)
+    repo.save(sampleLedger())
+
+    wb = openpyxl.load_workbook(path)
+    ws = wb["Transactions"]
+    header = [c.value for c in ws[1]]
+    for row in ws.iter_rows(min_row=2):
+        if row[header.index("id")].value == "b":
+            row[header.index("amount")].value = 55
+    wb.save(path)
+
+    assert repo.summarizeMonth("2025-01") is None
+    assert repo.summarizeMonths(date(2025, 1, 1), date(2025, 2, 1)) is None
+    assert ReportingService(PandasExcelLedgerRepository(path)).monthlySummary("2025-01").expense == 55
@@ -0,0 +1,25 @@
+from datetime import date
+
+import openpyxl
+
+from core.account import Account
+from core.ledger import Ledger
+from core.transaction import Expense
+from storage.excelRepository import PandasExcelLedgerRepository
+from storage.streamingImport import streamTransactions
+
+# a snapshot saved with MonthlyTotals as the active sheet still imports its Transactions sheet
+def test_workbook_import_reads_the_transactions_sheet(tmp_path):
+    path = tmp_path / "t.xlsx"
+    source = Ledger()
+    source.addAccount(Account("cash"))
+    source.addTransaction(Expense("a", date(2025, 1, 4), "cash", "food", 40, "shop", ""))
+    PandasExcelLedgerRepository(path).save(source)
+    wb = openpyxl.load_workbook(path)
+    wb.active = wb.sheetnames.index("MonthlyTotals")
+    wb.save(path)
+
+    ledger = Ledger()
+    result = streamTransactions(path, ledger)
+    assert (result.rowsRead, result.added) == (1, 1)
+    assert ledger.getTransaction("a").amount == 40
@@ -0,0 +1,152 @@
+import threading
+import time
+from datetime import date
+
+from core.account import Account
+from core.ledger import Ledger
+from core.transaction import Income, Expense
+from storage.journalRepository import JournaledExcelLedgerRepository
+from storage.repository import rebaseLedger, rowState
+
+def expense(tid, amount, day=4, notes=""):
+    return Expense(tid, date(2025, 1, day), "cash", "food", amount, "shop", notes)
+
+def journaled(path):
+    return JournaledExcelLedgerRepository(path, background=False)
+
+def records(ledger):
+    return sorted(t.record().items() for t in ledger.allTransactions())
+
+def test_journal_and_compaction_round_trip(tmp_path):
+    path = tmp_path / "t.xlsx"
+    repo = journaled(path)
+    ledger = Ledger()
+    ledger.addAccount(Account("cash"))
+    ledger.addTransaction(Income("a", date(2025, 1, 3), "cash", "pay", 1000, "boss", ""))
+    repo.save(ledger)
+
+    repo.appendTransactions([expense("b", 40), expense("c", 12)])
+    assert repo._journal_path.exists()
+    before = records(repo.load())
+    assert len(before) == 3
+
+    repo.compact()
+    assert not repo._journal_path.exists() and not repo._pending_path.exists()
+    assert records(journaled(path).load()) == before
+    assert repo.summarizeMonth("2025-01").expense == 52
+
+    # a compaction that died after moving the journal aside is picked up by the next one
+    repo.appendTransaction(expense("d", 8))
+    repo._journal_path.replace(repo._pending_path)
+    repo.appendTransaction(expense("e", 2))
+    assert {t.id for t in repo.load().allTransactions()} == {"a", "b", "c", "d", "e"}
+    repo.compact()
+    assert not repo._pending_path.exists() and repo._journal_path.exists()
+    assert {t.id for t in journaled(path).load().allTransactions()} == {"a", "b", "c", "d", "e"}
+
+# another process compacting between the snapshot and journal reads must not lose the journaled rows
+def test_load_retries_a_read_raced_by_compaction(tmp_path):
+    path = tmp_path / "t.xlsx"
+    writer = journaled(path)
+    ledger = Ledger()
+    ledger.addAccount(Account("cash"))
+    writer.save(ledger)
+    writer.appendTransactions([expense("a", 5), expense("b", 6)])
+
+    reader = journaled(path)
+    replay = reader.replayJournal
+    raced = []
+
+    def compactFirst(journal, into):
+        if not raced:
+            raced.append(True)
+            writer.compact()
+        return replay(journal, into)
+
+    reader.replayJournal = compactFirst
+    assert {t.id for t in reader.load().allTransactions()} == {"a", "b"}
+    assert raced
+
+def test_rebase_takes_their_new_and_changed_rows_and_keeps_ours():
+    def ledgerWith(*transactions):
+        ledger = Ledger()
+        ledger.addAccount(Account("cash"))
+        for t in transactions:
+            ledger.addTransaction(t)
+        return ledger
+
+    loaded = ledgerWith(expense("same", 1), expense("theirs", 2), expense("both", 3), expense("mineGone", 4),
+                        expense("theirsGone", 5))
+    base = {t.id: rowState(t) for t in loaded.allTransactions()}
+    ours = ledgerWith(expense("same", 1), expense("theirs", 2), expense("both", 30, notes="ours"),
+                      expense("theirsGone", 5), expense("mineNew", 6))
+    theirs = ledgerWith(expense("same", 1), expense("theirs", 20), expense("both", 31, notes="theirs"),
+                        expense("mineGone", 4), expense("theirNew", 7))
+    theirs.addAccount(Account("savings"))
+
+    assert rebaseLedger(ours, theirs, base) == 2
+    amounts = {t.id: t.amount for t in ours.allTransactions()}
+    assert amounts == {"same": 1, "theirs": 20, "both": 30, "theirsGone": 5, "mineNew": 6, "theirNew": 7}
+    assert ours.getAccount("savings") is not None
+
+# two repos saving from the same load both keep their rows
+def test_concurrent_saves_are_rebased(tmp_path):
+    path = tmp_path / "t.xlsx"
+    first = journaled(path)
+    ledger = Ledger()
+    ledger.addAccount(Account("cash"))
+    ledger.addTransaction(expense("a", 1))
+    first.save(ledger)
+
+    second = journaled(path)
+    mine, theirs = first.load(), second.load()
+    mine.addTransaction(expense("a", 10))
+    theirs.addTransaction(expense("b", 2))
+    second.save(theirs)
+    first.save(mine)
+
+    assert {t.id: t.amount for t in journaled(path).load().allTransactions()} == {"a": 10, "b": 2}
+
+# a currency change is a change like any other, a rebase takes it from whichever side made it
+def test_rebase_takes_their_currency_change():
+    ours, theirs = Ledger(), Ledger()
+    for ledger in (ours, theirs):
+        ledger.addAccount(Account("cash"))
+    ours.addTransaction(Expense("a", date(2025, 1, 4), "cash", "food", 5, "shop", "", "CAD"))
+    base = {"a": rowState(ours.getTransaction("a"))}
+    theirs.addTransaction(Expense("a", date(2025, 1, 4), "cash", "food", 5, "shop", "", "USD"))
+    assert rebaseLedger(ours, theirs, base) == 1
+    assert ours.getTransaction("a").currency == "USD"
+
+# a load that ends up taking the file lock and a compaction on the same repo take the locks in the
+# same order, neither waits on the other forever
+def test_locked_load_and_compaction_do_not_deadlock(tmp_path):
+    path = tmp_path / "t.xlsx"
+    repo = journaled(path)
+    ledger = Ledger()
+    ledger.addAccount(Account("cash"))
+    repo.save(ledger)
+    repo.appendTransactions([expense("a", 5)])
+
+    reading, resume = threading.Event(), threading.Event()
+    replay = repo.replayJournal
+
+    def pausedReplay(journal, into):
+        if threading.current_thread().name == "compactor":
+            reading.set()
+            resume.wait(5)
+        return replay(journal, into)
+
+    repo.replayJournal = pausedReplay
+    compactor = threading.Thread(target=repo.compact, name="compactor", daemon=True)
+    compactor.start()
+    assert reading.wait(5)
+    loaded = []
+    loader = threading.Thread(target=lambda: loaded.append(repo.load(retries=0)), daemon=True)
+    loader.start()
+    time.sleep(0.2)
+    resume.set()
+    compactor.join(5)
+    loader.join(5)
+    assert not compactor.is_alive() and not loader.is_alive()
+    assert [t.id for t in loaded[0].allTransactions()] == ["a"]
@@ -0,0 +1,166 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from core.account import Account
+from core.columnarLedger import ColumnarLedger
+from core.ledger import Ledger
+from core.transaction import Income, Expense
+
+ACCOUNTS = [("cash", "CAD"), ("card", "USD"), ("euro", "EUR")]
+START = date(2024, 1, 1)
+
+def randomTransaction(rng, tid):
+    d = START + timedelta(days=rng.randrange(120))
+    account = rng.choice(ACCOUNTS)[0]
+    category = rng.choice(["food", "rent", "pay", "fun"])
+    amount = rng.choice([0, round(rng.uniform(1, 500), 2)])
+    notes = rng.choice(["", "hydro bill", "coffee", "hydro refund"])
+    currency = rng.choice([None, None, "USD"])
+    if rng.random() < 0.3:
+        return Income(tid, d, account, category, amount, rng.choice(["boss", "mom"]), notes, currency)
+    return Expense(tid, d, account, category, amount, rng.choice(["shop", "landlord"]), notes, currency)
+
+def columns(ledger, start, end):
+    cols = ledger.rangeColumns(start, end)
+    label = cols["label"]
+    return [
+        (cols["days"][i], cols["cents"][i], bool(cols["income"][i]), label(cols["category"][i]),
+         label(cols["currency"][i]), cols["idAt"](i))
+        for i in range(len(cols["days"]))
+    ]
+
+def state(ledger):
+    window = (START + timedelta(days=20), START + timedelta(days=75))
+    return {
+        "all": [t.record() for t in ledger.listRange(None, None)],
+        "window": [t.id for t in ledger.listRange(*window)],
+        "iter": [t.id for t in ledger.iterRange(*window)],
+        "count": ledger.countRange(*window),
+        "size": len(ledger.allTransactions()),
+        "aggregates": ledger.aggregateRecords(),
+        "months": ledger.months(),
+        "month": [(c, ct.incomeCents, ct.expenseCents, ct.count, ct.first)
+                  for c, ct in ledger.monthlyTotals("2024-02").categories.items()],
+        "balances": ledger.balances(),
+        "balanceAt": ledger.balances(START + timedelta(days=40)),
+        "history": ledger.balanceHistory("card", *window),
+        "search": [t.id for t in ledger.search(text="hydro", kind="EXPENSE")],
+        "searchAccount": [t.id for t in ledger.search(account="cash", start=window[0], end=window[1])],
+        "fingerprints": len(ledger.fingerprints()),
+        "duplicates": [ledger.fingerprints().match(t, 3) is not None for t in ledger.listRange(*window)],
+        "currencies": ledger.currencies(),
+        "columns": columns(ledger, *window),
+        "dirty": ledger.dirtyMonths(),
+    }
+
+# the two storage layouts have to agree on everything the rest of the app reads from a ledger
+@pytest.mark.parametrize("seed", range(5))
+def test_columnar_ledger_matches_ledger(seed):
+    rng = random.Random(seed)
+    ledgers = [Ledger(), ColumnarLedger()]
+    events = [[], []]
+    for ledger, log in zip(ledgers, events):
+        for name, currency in ACCOUNTS:
+            ledger.addAccount(Account(name, currency=currency))
+        ledger.subscribe(lambda e, log=log: log.append((
+            e.kind,
+            e.transaction and e.transaction.record(),
+            e.previous and e.previous.record(),
+        )))
+    ids = []
+    for step in range(600):
+        op = rng.random()
+        if op < 0.6 or not ids:
+            tid = f"t{step}" if rng.random() < 0.5 else f"{rng.getrandbits(128):032x}"
+            ids.append(tid)
+        elif op < 0.8:
+            tid = rng.choice(ids)
+        else:
+            tid = rng.choice(ids)
+            for ledger in ledgers:
+                ledger.removeTransaction(tid)
+            continue
+        # each ledger gets its own object, Ledger keeps (and fills in) the one it's given
+        for ledger in ledgers:
+            ledger.addTransaction(randomTransaction(random.Random(f"{seed}-{step}"), tid))
+        if step % 100 == 99:
+            assert state(ledgers[0]) == state(ledgers[1])
+            for ledger in ledgers:
+                ledger.markClean()
+    assert state(ledgers[0]) == state(ledgers[1])
+    assert events[0] == events[1]
+
+def test_ledger_fills_in_the_account_currency():
+    for ledger in (Ledger(), ColumnarLedger()):
+        ledger.addAccount(Account("card", currency="USD"))
+        ledger.addTransaction(Expense("a", START, "card", "food", 5, "shop", ""))
+        ledger.addTransaction(Expense("b", START, "card", "food", 5, "shop", "", "EUR"))
+        assert [t.currency for t in ledger.listRange(None, None)] == ["USD", "EUR"]
+        assert ledger.monthlyTotals("2024-01").foreign == 2
+
+def test_removed_transaction_leaves_every_index():
+    for ledger in (Ledger(), ColumnarLedger()):
+        ledger.addAccount(Account("cash"))
+        ledger.addTransaction(Expense("a", START, "cash", "food", 5, "shop", "hydro"))
+        ledger.search(text="hydro")
+        removed = ledger.removeTransaction("a")
+        assert removed.id == "a" and removed.amount == 5
+        assert ledger.getTransaction("a") is None
+        assert ledger.listRange(None, None) == []
+        assert ledger.balance("cash") == 0
+        assert ledger.search(text="hydro") == []
+        assert ledger.monthlyTotals("2024-01").categories == {}
+        assert ledger.removeTransaction("a") is None
+
+# back-dated rows, and ones years either side of everything so far, move every later balance
+def test_balances_follow_back_dated_transactions():
+    rng = random.Random(7)
+    ledger = Ledger()
+    ledger.addAccount(Account("cash"))
+    added = []
+    for i in range(300):
+        d = START + timedelta(days=rng.randrange(-4000, 4000))
+        amount = round(rng.uniform(1, 100), 2)
+        ledger.addTransaction(Expense(str(i), d, "cash", "food", amount, "shop", ""))
+        added.append((d, amount))
+        on = START + timedelta(days=rng.randrange(-4000, 4000))
+        assert ledger.balance("cash", on) == pytest.approx(-sum(a for day, a in added if day <= on))
+    history = ledger.balanceHistory("cash")
+    assert [d for d, _ in history] == sorted({d for d, _ in added})
+    assert history[-1][1] == pytest.approx(-sum(a for _, a in added))
+
+# kind is the row's type, not the sign of its amount
+def test_zero_income_is_still_income():
+    for ledger in (Ledger(), ColumnarLedger()):
+        ledger.addAccount(Account("cash"))
+        ledger.addTransaction(Income("a", START, "cash", "pay", 0, "boss", "refund"))
+        assert ledger.getTransaction("a").kind == "INCOME"
+        assert [t.id for t in ledger.search(kind="INCOME")] == ["a"]
+        assert ledger.search(text="refund", kind="EXPENSE") == []
+
+# Ledger keeps its range columns through changes near the end of the date order and rebuilds them after
+# anything further back, either way they have to match the rows
+def test_ledger_range_columns_follow_changes(monkeypatch):
+    monkeypatch.setattr("core.ledger.COLUMN_SHIFT_LIMIT", 5)
+    rng = random.Random(3)
+    ledger = Ledger()
+    for name, currency in ACCOUNTS:
+        ledger.addAccount(Account(name, currency=currency))
+    for step in range(300):
+        if step % 7 == 6:
+            ledger.removeTransaction(rng.choice(list(ledger._transactions)))
+        else:
+            t = randomTransaction(rng, f"t{step}")
+            # mostly today's rows, now and then a back-dated one
+            if rng.random() < 0.8:
+                t.date = START + timedelta(days=120 + step)
+            ledger.addTransaction(t)
+        if step % 3 == 0:
+            fresh = Ledger()
+            for name, currency in ACCOUNTS:
+                fresh.addAccount(Account(name, currency=currency))
+            for t in ledger.allTransactions():
+                fresh.addTransaction(t)
+            assert columns(ledger, None, None) == columns(fresh, None, None)
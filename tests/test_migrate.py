@@ -0,0 +1,41 @@
+import shutil
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+from core.transaction import Expense
+from storage.journalRepository import JournaledExcelLedgerRepository
+from storage.migrate import migrateExcel, TARGETS
+
+TRACKER = Path(__file__).resolve().parents[1] / "src" / "storage" / "excelTracker.xlsx"
+
+@pytest.fixture
+def tracker(tmp_path):
+    path = tmp_path / "excelTracker.xlsx"
+    shutil.copy(TRACKER, path)
+    return path
+
+def target(name):
+    if name == "parquet":
+        pytest.importorskip("pyarrow")
+    return TARGETS[name]
+
+# rows that only live in the journal (appended since the last compaction) have to come along
+@pytest.mark.parametrize("to", sorted(TARGETS))
+def test_migrate_includes_journaled_transactions(tracker, tmp_path, to):
+    repository = target(to)
+    repo = JournaledExcelLedgerRepository(tracker, background=False)
+    stored = {t.id for t in repo.load().allTransactions()}
+    repo.appendTransactions([
+        Expense("journaled-1", date(2025, 2, 1), "cash", "food", 12.5, "shop", ""),
+        Expense("journaled-2", date(2025, 2, 2), "cash", "food", 3, "shop", ""),
+    ])
+    assert repo._journal_path.exists()
+
+    destination = tmp_path / f"migrated.{to}"
+    migrated = migrateExcel(tracker, destination, to)
+
+    ids = {t.id for t in repository(destination).load().allTransactions()}
+    assert migrated == len(stored) + 2
+    assert ids == stored | {"journaled-1", "journaled-2"}
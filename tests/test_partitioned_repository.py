@@ -0,0 +1,27 @@
+from datetime import date
+
+from core.account import Account
+from core.ledger import Ledger
+from core.transaction import Expense
+from storage.partitionedRepository import PartitionedLedgerRepository
+
+def expense(tid, month, amount):
+    return Expense(tid, date(2025, month, 4), "cash", "food", amount, "shop", "")
+
+# rows appended while a loaded ledger is around survive that ledger's next save
+def test_appended_rows_survive_a_save_of_the_loaded_ledger(tmp_path):
+    repo = PartitionedLedgerRepository(tmp_path)
+    ledger = Ledger()
+    ledger.addAccount(Account("cash"))
+    ledger.addTransaction(expense("a", 1, 5))
+    ledger.addTransaction(expense("b", 2, 6))
+    repo.save(ledger)
+
+    loaded = repo.load()
+    repo.appendTransactions([expense("c", 1, 7), expense("d", 3, 8)])
+    loaded.addTransaction(expense("e", 1, 9))
+    repo.save(loaded)
+
+    stored = {t.id: t.amount for t in PartitionedLedgerRepository(tmp_path).load().allTransactions()}
+    assert stored == {"a": 5, "b": 6, "c": 7, "d": 8, "e": 9}
+    assert repo.summarizeMonth("2025-01").expense == 21
@@ -0,0 +1,61 @@
+from datetime import date
+
+from core import instrumentation
+from core.account import Account
+from core.ledger import Ledger
+from core.transaction import Expense
+from services.reporting import ReportingService
+from storage.sqliteRepository import SqliteLedgerRepository
+
+def rowsWritten(repo, ledger):
+    instrumentation.registry.reset()
+    instrumentation.enable()
+    try:
+        repo.save(ledger)
+    finally:
+        instrumentation.disable()
+    return instrumentation.registry.snapshot()["spans"]["sqlite.save"]["counters"]["rowsWritten"]
+
+# rows stored without a currency get the account's once loaded, that alone isn't a change to write back
+def test_save_only_writes_changed_rows(tmp_path):
+    path = tmp_path / "t.db"
+    repo = SqliteLedgerRepository(path)
+    ledger = Ledger()
+    ledger.addAccount(Account("card", currency="USD"))
+    repo.save(ledger)
+    repo.appendTransactions([Expense(str(i), date(2025, 1, i + 1), "card", "food", 5 + i, "shop", "") for i in range(5)])
+    assert rowsWritten(repo, repo.load()) == 0
+
+    reopened = SqliteLedgerRepository(path)
+    ledger = reopened.load()
+    assert {t.currency for t in ledger.allTransactions()} == {"USD"}
+    assert rowsWritten(reopened, ledger) == 0
+    ledger.addTransaction(Expense("1", date(2025, 1, 2), "card", "food", 50, "shop", ""))
+    assert rowsWritten(reopened, ledger) == 1
+    assert SqliteLedgerRepository(path).load().getTransaction("1").amount == 50
+
+# appends are remembered like loaded rows, a save of the ledger they also went into doesn't write them again
+def test_appended_rows_are_not_written_again(tmp_path):
+    repo = SqliteLedgerRepository(tmp_path / "t.db")
+    ledger = repo.load()
+    ledger.addAccount(Account("cash"))
+    appended = [Expense(str(i), date(2025, 1, 1), "cash", "food", 1, "shop", "") for i in range(5)]
+    repo.appendTransactions(appended)
+    for t in appended:
+        ledger.addTransaction(t)
+    ledger.addTransaction(Expense("x", date(2025, 1, 2), "cash", "food", 1, "shop", ""))
+    assert rowsWritten(repo, ledger) == 1
+
+# no month means every month, same report as the other repos give
+def test_summary_without_a_month_covers_everything(tmp_path):
+    repo = SqliteLedgerRepository(tmp_path / "t.db")
+    ledger = Ledger()
+    ledger.addAccount(Account("cash"))
+    ledger.addTransaction(Expense("a", date(2025, 1, 4), "cash", "food", 5, "shop", ""))
+    ledger.addTransaction(Expense("b", date(2025, 3, 4), "cash", "rent", 7, "shop", ""))
+    repo.save(ledger)
+    service = ReportingService(repo)
+    for month in (None, ""):
+        report = service.monthlySummary(month)
+        assert (report.income, report.expense) == (0, 12)
+    assert service.monthlySummary("2025-03").expense == 7